@@ -4,14 +4,21 @@
 # or pip).
 # It adds icons to the workspace name for each open window.
 # Set your keybindings like this: set $workspace1 workspace number 1
-# Add your icons to WINDOW_ICONS.
+# Add your icons to WINDOW_ICONS, or add match rules to the config file
+# ($XDG_CONFIG_HOME/sway/autoname-workspaces.json), for example:
+#   [{"app_id": "org\\.telegram\\..*", "icon": ""}, {"title": "*YouTube*", "glob": true, "icon": ""}]
+# Windows are also matched through installed .desktop files, so WINDOW_ICONS
+# keys can be the Icon or Name of a desktop entry instead of the app_id.
 # Based on https://github.com/maximbaz/dotfiles/blob/master/bin/i3-autoname-workspaces
 
 import argparse
+import fnmatch
+import json
 import logging
+import os
 import re
 import signal
-import sys
+from functools import lru_cache, partial
 
 import i3ipc
 
@@ -21,43 +28,335 @@ WINDOW_ICONS = {
 
 DEFAULT_ICON = "󰀏"
 
+# logs to --logfile, also when hosted by plugin-host.py next to other scripts
+logger = logging.getLogger("autoname-workspaces")
+
+
+# Rules loaded from the config file, see load_icon_rules(). Each rule is a
+# ({field: compiled pattern}, icon) pair and the first matching rule wins.
+ICON_RULES: list[tuple[dict, str]] = []
+RULE_FIELDS = ("app_id", "class", "title", "instance")
+# fields the resolver cache is keyed on; title and instance only if a rule uses them
+KEY_FIELDS = {"app_id", "class"}
+ICON_CACHE_SIZE = 1024
+
+# container fields used with --lean-tree, see icon_for_window()
+TREE_FIELDS = ("app_id", "window_class", "window_instance")
+
+# app_id/class (lowercase) -> [icon name, name] from installed .desktop files
+DESKTOP_INDEX: dict[str, list[str]] = {}
+DESKTOP_INDEX_VERSION = 1
+
+
+def load_icon_rules(path):
+    """Load icon rules from a JSON file.
+
+    The file holds a list of rules such as
+    {"app_id": "org\\.gnome\\..*", "class": "...", "title": "...", "instance": "...", "icon": ""}.
+    Patterns are regular expressions matched case-insensitively against the whole
+    value, or shell globs if the rule has "glob": true.
+    """
+    try:
+        with open(path) as f:
+            rules = json.load(f)
+    except FileNotFoundError:
+        return []
+
+    compiled = []
+    for rule in rules:
+        # a broken rule is skipped rather than keeping the daemon from starting
+        if not isinstance(rule, dict) or not isinstance(rule.get("icon"), str):
+            logger.warning("Skipping icon rule without an icon: %s" % rule)
+            continue
+        patterns = {}
+        try:
+            for field in RULE_FIELDS:
+                if field in rule:
+                    pattern = fnmatch.translate(rule[field]) if rule.get("glob") else rule[field]
+                    patterns[field] = re.compile(pattern, re.IGNORECASE)
+        except (re.error, TypeError) as e:
+            logger.warning("Skipping icon rule %s: %s" % (rule, e))
+            continue
+        compiled.append((patterns, rule["icon"]))
+    return compiled
+
 
 def icon_for_window(window):
-    name = None
-    if window.app_id is not None and len(window.app_id) > 0:
-        name = window.app_id.lower()
-    elif window.window_class is not None and len(window.window_class) > 0:
-        name =  window.window_class.lower()
+    props = {
+        "app_id": window.app_id or None,
+        "class": window.window_class or None,
+        "title": window.name,
+        "instance": window.window_instance,
+    }
+    key = tuple(props[field] if field in KEY_FIELDS else None for field in RULE_FIELDS)
+    return resolve_icon(*key)
+
+
+def application_dirs():
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
+    data_dirs = os.environ.get("XDG_DATA_DIRS", "/usr/local/share:/usr/share").split(":")
+    # in priority order, earlier directories shadow later ones
+    return [os.path.join(d, "applications") for d in [data_home] + data_dirs if d]
+
+
+def directory_mtimes(dirs):
+    """Return the mtimes of dirs and of all directories below them."""
+    mtimes = {}
+    for top in dirs:
+        for dirpath, _, _ in os.walk(top):
+            try:
+                mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                pass
+    return mtimes
+
+
+def parse_desktop_entry(path):
+    entry = {}
+    in_group = False
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    if in_group:
+                        break
+                    in_group = line == "[Desktop Entry]"
+                elif in_group and "=" in line:
+                    key, value = line.split("=", 1)
+                    if key.strip() in ("StartupWMClass", "Icon", "Name"):
+                        entry[key.strip()] = value.strip()
+    except OSError:
+        pass
+    return entry
+
+
+def build_desktop_index(dirs):
+    index = {}
+    for top in dirs:
+        for dirpath, _, filenames in os.walk(top):
+            for filename in filenames:
+                if not filename.endswith(".desktop"):
+                    continue
+                entry = parse_desktop_entry(os.path.join(dirpath, filename))
+                if "Icon" not in entry and "Name" not in entry:
+                    continue
+                value = [entry.get("Icon"), entry.get("Name")]
+                index.setdefault(filename[: -len(".desktop")].lower(), value)
+                if "StartupWMClass" in entry:
+                    index.setdefault(entry["StartupWMClass"].lower(), value)
+    return index
+
+
+def load_desktop_index(cache_path):
+    """Return the desktop entry index, rebuilding the cache file if it is stale.
+
+    The cache is keyed on the mtimes of the application directories, which
+    change whenever a .desktop file is added or removed, so a normal start only
+    reads the cache file instead of parsing every desktop entry.
+    """
+    dirs = application_dirs()
+    mtimes = directory_mtimes(dirs)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if cache["version"] == DESKTOP_INDEX_VERSION and cache["mtimes"] == mtimes:
+            return cache["index"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
 
+    logger.info("Rebuilding desktop entry index %s" % cache_path)
+    index = build_desktop_index(dirs)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": DESKTOP_INDEX_VERSION, "mtimes": mtimes, "index": index}, f, separators=(",", ":"))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning("Could not write desktop entry index: %s" % e)
+    return index
+
+
+@lru_cache(maxsize=ICON_CACHE_SIZE)
+def resolve_icon(app_id, window_class, title, instance):
+    props = {"app_id": app_id, "class": window_class, "title": title, "instance": instance}
+    for patterns, icon in ICON_RULES:
+        if all(props[field] is not None and pattern.fullmatch(props[field])
+               for field, pattern in patterns.items()):
+            return icon
+
+    name = app_id.lower() if app_id else window_class.lower() if window_class else None
     if name in WINDOW_ICONS:
         return WINDOW_ICONS[name]
 
-    logging.info("No icon available for window with name: %s" % str(name))
+    # desktop entries map e.g. org.mozilla.firefox or a WM class to the icon
+    # name "firefox" and the name "Firefox", which can be looked up instead
+    for alias in DESKTOP_INDEX.get(name) or ():
+        if alias and alias.lower() in WINDOW_ICONS:
+            return WINDOW_ICONS[alias.lower()]
+
+    # results are cached, so this is logged once per window key
+    logger.info("No icon available for window with name: %s" % str(name))
     return DEFAULT_ICON
 
-def rename_workspaces(ipc):
-    for workspace in ipc.get_tree().workspaces():
-        name_parts = parse_workspace_name(workspace.name)
-        icon_tuple = ()
+
+class WorkspaceIcons:
+    """Per-workspace icon model, so only workspaces touched by an event are renamed."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.names = {}  # workspace id -> current workspace name
+        self.icons = {}  # workspace id -> {container id: icon}, in tree order
+        self.con_to_ws = {}  # container id -> workspace id
+
+    def load_workspace(self, workspace):
+        """(Re)build the model of one workspace from its tree node."""
+        for con_id in self.icons.pop(workspace.id, {}):
+            self.con_to_ws.pop(con_id, None)
+        self.names[workspace.id] = workspace.name
+        icons = {}
         for w in workspace:
             if w.app_id is not None or w.window_class is not None:
-                icon = icon_for_window(w)
-                if not ARGUMENTS.duplicates and icon in icon_tuple:
-                    continue
-                icon_tuple += (icon,)
+                icons[w.id] = icon_for_window(w)
+                self.con_to_ws[w.id] = workspace.id
+        self.icons[workspace.id] = icons
+
+    def update_icon(self, ws_id, window):
+        """Recompute the icon of a window in the model, returning whether it changed."""
+        icon = icon_for_window(window)
+        if self.icons[ws_id].get(window.id) == icon:
+            return False
+        self.icons[ws_id][window.id] = icon
+        return True
+
+    def remove_window(self, con_id):
+        """Forget a container, returning the id of the workspace it was on."""
+        ws_id = self.con_to_ws.pop(con_id, None)
+        if ws_id is not None:
+            self.icons[ws_id].pop(con_id, None)
+        return ws_id
+
+    def forget_workspace(self, ws_id):
+        for con_id in self.icons.pop(ws_id, {}):
+            self.con_to_ws.pop(con_id, None)
+        self.names.pop(ws_id, None)
+
+    def rename_command(self, ws_id):
+        """Return the rename command for a workspace, or None if its name is unchanged."""
+        name = self.names[ws_id]
+        name_parts = parse_workspace_name(name)
+        icon_tuple = ()
+        for icon in self.icons[ws_id].values():
+            if not ARGUMENTS.duplicates and icon in icon_tuple:
+                continue
+            icon_tuple += (icon,)
         name_parts["icons"] = "  ".join(icon_tuple) + " "
         new_name = construct_workspace_name(name_parts)
-        ipc.command('rename workspace "%s" to "%s"' % (workspace.name, new_name))
+        if new_name == name:
+            return None
+        self.names[ws_id] = new_name
+        return 'rename workspace "%s" to "%s"' % (name, new_name)
+
+
+def get_tree(ipc):
+    if ARGUMENTS.lean_tree:
+        import swaytree
+
+        return swaytree.get_tree(ipc, TREE_FIELDS)
+    return ipc.get_tree()
+
+
+def send_renames(ipc, model, ws_ids):
+    commands = []
+    for ws_id in ws_ids:
+        if ws_id in model.names:
+            command = model.rename_command(ws_id)
+            if command is not None:
+                commands.append(command)
+    # one message for all renames instead of a round trip per workspace
+    if commands:
+        ipc.command("; ".join(commands))
+
+
+def rename_workspaces(ipc, model):
+    model.clear()
+    for workspace in get_tree(ipc).workspaces():
+        model.load_workspace(workspace)
+    send_renames(ipc, model, list(model.names))
+
+
+def update_workspaces(ipc, model, events):
+    touched = []
+    placed = set()  # containers whose (new) workspace has to be looked up
+    for event in events:
+        if event.change in ["close", "move"]:
+            # a moved split container takes its windows along, and only the
+            # windows are in the model, so look them up through the subtree
+            # the event carries
+            for con in [event.container, *event.container.descendants()]:
+                ws_id = model.remove_window(con.id)
+                if ws_id is not None and ws_id not in touched:
+                    touched.append(ws_id)
+        if event.change in ["new", "move"]:
+            placed.add(event.container.id)
+        if event.change == "title":
+            # windows often set their real title after they are mapped, and
+            # title rules only get to see it now
+            ws_id = model.con_to_ws.get(event.container.id)
+            if ws_id is None:
+                placed.add(event.container.id)
+            elif model.update_icon(ws_id, event.container) and ws_id not in touched:
+                touched.append(ws_id)
+    if placed:
+        # the events only carry the containers, so the tree is needed to find their
+        # workspaces; only the source and destination workspaces are recomputed though
+        found = set()
+        for workspace in get_tree(ipc).workspaces():
+            if workspace.id in touched or any(con.id in placed for con in workspace):
+                model.load_workspace(workspace)
+                found.add(workspace.id)
+        for ws_id in touched:
+            if ws_id not in found:
+                model.forget_workspace(ws_id)
+        touched.extend(ws_id for ws_id in found if ws_id not in touched)
+    send_renames(ipc, model, touched)
+
+
+def flush_events(ipc, model, events):
+    if len(events) > 1:
+        logger.info("%d events handled as one", len(events))
+    window_events = []
+    for kind, event in events:
+        if kind == "workspace":
+            workspace_event_handler(model, ipc, event)
+        else:
+            window_events.append(event)
+    update_workspaces(ipc, model, window_events)
+
+
+def workspace_event_handler(model, ipc, e):
+    if e.current is None:
+        return
+    if e.change == "empty":
+        model.forget_workspace(e.current.id)
+    elif e.change in ["init", "rename"] and e.current.name:
+        # keep names in sync with renames done by the user or other tools
+        model.names[e.current.id] = e.current.name
+        model.icons.setdefault(e.current.id, {})
 
 
 def undo_window_renaming(ipc):
-    for workspace in ipc.get_tree().workspaces():
+    commands = []
+    for workspace in get_tree(ipc).workspaces():
         name_parts = parse_workspace_name(workspace.name)
         name_parts["icons"] = None
         new_name = construct_workspace_name(name_parts)
-        ipc.command('rename workspace "%s" to "%s"' % (workspace.name, new_name))
-    ipc.main_quit()
-    sys.exit(0)
+        commands.append('rename workspace "%s" to "%s"' % (workspace.name, new_name))
+    if commands:
+        ipc.command("; ".join(commands))
 
 
 def parse_workspace_name(name):
@@ -80,7 +379,7 @@ def construct_workspace_name(parts):
     return new_name
 
 
-if __name__ == "__main__":
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="This script automatically changes the workspace name in sway depending on your open applications."
     )
@@ -97,29 +396,121 @@ if __name__ == "__main__":
         default="/tmp/sway-autoname-workspaces.log",
         help="Path for the logfile.",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        default=os.path.join(
+            os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), "sway", "autoname-workspaces.json"
+        ),
+        help="Path for the JSON file with icon rules.",
+    )
+    parser.add_argument(
+        "--desktop-cache",
+        type=str,
+        default=os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "sway-autoname-workspaces.json"
+        ),
+        help="Path for the cached index of installed .desktop files.",
+    )
+    parser.add_argument(
+        "--no-desktop-entries",
+        action="store_true",
+        help="Do not look up icons through installed .desktop files.",
+    )
+    parser.add_argument(
+        "--coalesce",
+        type=float,
+        default=0.0,
+        help="Handle window events together once none arrived for this many seconds, 0 disables it.",
+    )
+    parser.add_argument(
+        "--coalesce-max-delay",
+        type=float,
+        default=0.5,
+        help="Handle coalesced events at the latest this many seconds after the first one.",
+    )
+    parser.add_argument(
+        "--lean-tree",
+        action="store_true",
+        help="Read the layout tree with swaytree.py, keeping only the fields used here.",
+    )
+    return parser.parse_args(argv)
+
+
+def setup(ipc, args):
+    """Subscribe to the events of ipc and name the workspaces.
+
+    Returns the function that undoes the renaming on exit.
+    """
     global ARGUMENTS
     ARGUMENTS = args
 
-    logging.basicConfig(
-        level=logging.INFO,
-        filename=ARGUMENTS.logfile,
-        filemode="w",
-        format="%(message)s",
-    )
+    handler = logging.FileHandler(ARGUMENTS.logfile, mode="w")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
 
-    ipc = i3ipc.Connection()
+    ICON_RULES.extend(load_icon_rules(ARGUMENTS.config))
+    for patterns, _ in ICON_RULES:
+        KEY_FIELDS.update(patterns)
+    if not ARGUMENTS.no_desktop_entries:
+        DESKTOP_INDEX.update(load_desktop_index(ARGUMENTS.desktop_cache))
 
-    for sig in [signal.SIGINT, signal.SIGTERM]:
-        signal.signal(sig, lambda signal, frame: undo_window_renaming(ipc))
+    model = WorkspaceIcons()
+    # a title change only matters to rules looking at the title
+    changes = ["new", "close", "move"] + (["title"] if "title" in KEY_FIELDS else [])
+
+    if ARGUMENTS.coalesce > 0:
+        # a burst of events, like a session being restored, is handled in one
+        # go against the final tree, both kinds in order
+        from coalescer import Coalescer
+
+        coalescer = Coalescer(
+            partial(flush_events, ipc, model), ARGUMENTS.coalesce, ARGUMENTS.coalesce_max_delay
+        )
+
+        def window_event_handler(ipc, e):
+            if e.change in changes:
+                coalescer.push(("window", e))
 
-    def window_event_handler(ipc, e):
-        if e.change in ["new", "close", "move"]:
-            rename_workspaces(ipc)
+        ipc.on("window", window_event_handler)
+        ipc.on("workspace", lambda ipc, e: coalescer.push(("workspace", e)))
+    else:
+        coalescer = None
 
-    ipc.on("window", window_event_handler)
+        def window_event_handler(ipc, e):
+            if e.change in changes:
+                update_workspaces(ipc, model, [e])
 
-    rename_workspaces(ipc)
+        ipc.on("window", window_event_handler)
+        ipc.on("workspace", partial(workspace_event_handler, model))
+
+    rename_workspaces(ipc, model)
+
+    def cleanup():
+        if coalescer is not None:
+            coalescer.stop()
+            logger.info("%d of %d events were coalesced", coalescer.folded, coalescer.received)
+        undo_window_renaming(ipc)
+
+    return cleanup
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    ipc = i3ipc.Connection()
+    cleanup = setup(ipc, args)
+
+    def on_exit(signum, frame):
+        # stopping the coalescer takes its lock, which a flush in progress
+        # holds, so only stop the loop here and clean up once it returned
+        ipc.main_quit()
+
+    for sig in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(sig, on_exit)
 
     ipc.main()
+    cleanup()
 
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+# Benchmark the event handling of the scripts of this repository against
+# fakesway.py, with the same synthetic tree and trace of events for all.
+#
+# Each script runs unchanged in its own process, started the way it is from
+# the sway config. The only difference is a wrapper around the dispatching
+# of events in i3ipc that reports back when the handlers of an event
+# returned. The next event is sent right then, like in a burst of events,
+# so every request the fake sway gets in between is counted for that
+# event. For each script this reports:
+#
+#   - latency: from sending the event to its handlers returning, which
+#     includes decoding the event in i3ipc
+#   - handler: the time spent in the handlers alone
+#   - round trips: requests made while handling an event, and requests made
+#     later from timers (--coalesce, fading, delayed writes) as "deferred"
+#   - peak RSS of the process
+#
+#   ./bench-daemons.py --workspaces 20 --windows 30 --events 2000
+#   ./bench-daemons.py --only autoname-workspaces.py --args "autoname-workspaces.py --lean-tree"
+#
+# This script requires i3ipc-python package (install it from a system package
+# manager or pip).
+
+import argparse
+import json
+import os
+import resource
+import runpy
+import select
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from typing import Any, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+
+loader = SourceFileLoader("fakesway", os.path.join(HERE, "fakesway.py"))
+spec = spec_from_loader(loader.name, loader)
+assert spec is not None
+fakesway = module_from_spec(spec)
+loader.exec_module(fakesway)
+
+# the scripts with the arguments to run them as daemons, {tmp} is a
+# directory for their logs, caches and stores
+DAEMONS = {
+    "autoname-workspaces.py": ["--no-desktop-entries", "--logfile", "{tmp}/autoname-workspaces.log"],
+    "inactive-windows-transparency.py": [],
+    "layout-per-window.py": ["0"],
+    "switch-top-level.py": [],
+    "firefox-focus-monitor.py": [],
+    "sort-container.py": ["--daemon"],
+    "swaystack.py": ["--daemon"],
+}
+
+
+def child(script: str, argv: list[str]) -> None:
+    "run script with timing of the event handlers, reported on BENCH_ACK_FD"
+    from i3ipc._private.pubsub import PubSub
+
+    ack = int(os.environ["BENCH_ACK_FD"])
+    emit = PubSub.emit
+
+    def timed_emit(self: PubSub, event: str, data: Any) -> None:
+        if event == "ipc_shutdown":
+            emit(self, event, data)
+            return
+        start = time.perf_counter_ns()
+        try:
+            emit(self, event, data)
+        finally:
+            os.write(ack, b"event %d\n" % (time.perf_counter_ns() - start))
+
+    PubSub.emit = timed_emit  # type: ignore[method-assign]
+    sys.argv = [script, *argv]
+    sys.path.insert(0, os.path.dirname(script))
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+    finally:
+        os.write(ack, b"rss %d\n" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+class Acks:
+    "the lines a child writes to its ack pipe"
+
+    def __init__(self, fd: int) -> None:
+        self.fd = fd
+        self.buffer = b""
+
+    def read(self, timeout: float) -> Optional[tuple[str, int]]:
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.fd], [], [], remaining)[0]:
+                return None
+            data = os.read(self.fd, 4096)
+            if not data:
+                return None
+            self.buffer += data
+        (line, self.buffer) = self.buffer.split(b"\n", 1)
+        (kind, value) = line.decode().split()
+        return (kind, int(value))
+
+
+def settle(sway: Any, quiet: float = 0.2, limit: float = 10.0) -> None:
+    "wait until no requests arrived for quiet seconds"
+    deadline = time.monotonic() + limit
+    count = -1
+    while count != sway.requests and time.monotonic() < deadline:
+        count = sway.requests
+        time.sleep(quiet)
+
+
+def bench(script: str, argv: list[str], tree: dict, trace: list[dict], args: argparse.Namespace) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="bench-daemons-") as tmp:
+        path = os.path.join(tmp, "sway.sock")
+        sway = fakesway.FakeSway(path, json.loads(json.dumps(tree))).start()
+        (read_fd, write_fd) = os.pipe()
+        env = dict(
+            os.environ,
+            SWAYSOCK=path,
+            I3SOCK=path,
+            BENCH_ACK_FD=str(write_fd),
+            XDG_CONFIG_HOME=tmp,
+            XDG_CACHE_HOME=tmp,
+            XDG_STATE_HOME=tmp,
+            XDG_DATA_HOME=tmp,
+        )
+        log = open(os.path.join(tmp, "stderr"), "w+")
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--child", os.path.join(REPO, script),
+             *(arg.format(tmp=tmp) for arg in argv)],
+            env=env,
+            pass_fds=(write_fd,),
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else log,
+        )
+        os.close(write_fd)
+        acks = Acks(read_fd)
+        result: dict[str, Any] = {"script": script, "args": argv}
+        try:
+            if not sway.subscribed.wait(args.timeout):
+                raise RuntimeError("did not subscribe to any events")
+            settle(sway)
+            result["startup_requests"] = sway.requests
+            subscriptions = sway.subscriptions()
+
+            latencies = []
+            handlers = []
+            requests = []
+            for entry in trace:
+                event_type = entry["type"]
+                if event_type not in subscriptions:
+                    # building the event still changes the tree
+                    with sway.lock:
+                        sway.event(entry)
+                    continue
+                before = sway.requests
+                start = time.perf_counter_ns()
+                sway.play(entry)
+                ack = acks.read(args.timeout)
+                if ack is None:
+                    raise RuntimeError(f"no reply to {event_type} event {entry.get('change', '')}")
+                latencies.append(time.perf_counter_ns() - start)
+                handlers.append(ack[1])
+                requests.append(sway.requests - before)
+            settle(sway)
+
+            result.update(
+                events=len(latencies),
+                latency=summary(latencies),
+                handler=summary(handlers),
+                round_trips=sum(requests) / max(1, len(requests)),
+                max_round_trips=max(requests, default=0),
+                deferred=sway.requests - result["startup_requests"] - sum(requests),
+                commands=len(sway.commands),
+            )
+            sway.close_subscriptions()
+            while (ack := acks.read(args.timeout)) is not None:
+                if ack[0] == "rss":
+                    result["peak_rss"] = ack[1] * 1024
+                    break
+        except RuntimeError as e:
+            log.seek(0)
+            result["error"] = f"{e}\n{log.read()}"
+        finally:
+            if proc.poll() is None:
+                proc.terminate()
+            try:
+                proc.wait(args.timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            os.close(read_fd)
+            log.close()
+            sway.stop()
+        return result
+
+
+def summary(samples: list[int]) -> dict[str, float]:
+    "mean, median, 95th percentile and maximum of samples in ns, in ms"
+    if not samples:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered) / 1e6,
+        "p50": ordered[len(ordered) // 2] / 1e6,
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] / 1e6,
+        "max": ordered[-1] / 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the event handling of the sway-contrib daemons.")
+    parser.add_argument("--workspaces", type=int, default=10, help="number of workspaces of the synthetic tree")
+    parser.add_argument("--windows", type=int, default=10, help="number of windows per workspace")
+    parser.add_argument("--events", type=int, default=1000, help="number of events to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the tree and the generated events")
+    parser.add_argument("--trace", help="replay this trace file (see fakesway.py --capture) instead")
+    parser.add_argument(
+        "--only", action="append", choices=sorted(DAEMONS), help="benchmark only this script (repeatable)"
+    )
+    parser.add_argument(
+        "--args",
+        action="append",
+        default=[],
+        metavar="'SCRIPT ARGS'",
+        help="extra arguments for a script, e.g. 'autoname-workspaces.py --lean-tree' (repeatable)",
+    )
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for a script to react")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", "-v", action="store_true", help="show the output of the scripts")
+    args = parser.parse_args()
+
+    extra: dict[str, list[str]] = {}
+    for arg in args.args:
+        (script, *rest) = shlex.split(arg)
+        if script not in DAEMONS:
+            parser.error(f"unknown script {script}")
+        extra.setdefault(script, []).extend(rest)
+
+    tree = fakesway.synthetic_tree(args.workspaces, args.windows, args.seed)
+    if args.trace:
+        (trace_tree, trace) = fakesway.load_trace(args.trace)
+        tree = trace_tree or tree
+    else:
+        trace = fakesway.generate_trace(tree, args.events, args.seed)
+
+    print(
+        "{:<34} {:>6} {:>9} {:>9} {:>9} {:>9} {:>7} {:>8} {:>8}".format(
+            "script", "events", "mean ms", "p95 ms", "max ms", "hdl ms", "rt/ev", "deferred", "rss MB"
+        )
+    )
+    results = []
+    failed = False
+    for (script, argv) in DAEMONS.items():
+        if args.only and script not in args.only:
+            continue
+        result = bench(script, argv + extra.get(script, []), tree, trace, args)
+        results.append(result)
+        if "error" in result:
+            failed = True
+            print(f"{script:<34} failed: {result['error']}")
+            continue
+        print(
+            "{:<34} {:>6} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>7.2f} {:>8} {:>8.1f}".format(
+                script,
+                result["events"],
+                result["latency"]["mean"],
+                result["latency"]["p95"],
+                result["latency"]["max"],
+                result["handler"]["mean"],
+                result["round_trips"],
+                result["deferred"],
+                result.get("peak_rss", 0) / 2**20,
+            )
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"workspaces": args.workspaces, "windows": args.windows, "trace": args.trace or args.events,
+                 "results": results},
+                f,
+                indent=2,
+            )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], sys.argv[3:])
+    else:
+        main()
@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+
+# A stand-in for sway to run the scripts of this repository against, without
+# a compositor. It speaks the sway IPC protocol on a Unix socket, serves a
+# synthetic layout tree of N workspaces with M windows each, replays traces of
+# events and records every command it receives.
+#
+# Serve a tree and replay a generated trace once a script subscribed:
+#
+#   ./fakesway.py --socket /tmp/fakesway.sock --workspaces 10 --windows 20 --events 500
+#   SWAYSOCK=/tmp/fakesway.sock ../inactive-windows-transparency.py
+#
+# Record a trace on a real sway session, to replay it later with --trace:
+#
+#   ./fakesway.py --capture session.jsonl
+#
+# A trace is a JSON lines file. A line with a "tree" key replaces the tree
+# served, every other line is an event, either as sway sent it
+# ({"type": "window", "payload": {...}}) or described by the container it
+# is about ({"type": "window", "change": "focus", "con": 12}), in which
+# case the payload is built from the tree when the event is sent.
+#
+# The tree follows the events: focus, title, new, close and move events
+# change it, and so do "rename workspace" commands. Recorded events only
+# carry the window, so of those just focus, title and close are applied.
+#
+# Only the standard library is needed.
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import random
+import shlex
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+MAGIC = b"i3-ipc"
+HEADER = "=%dsII" % len(MAGIC)
+HEADER_SIZE = struct.calcsize(HEADER)
+
+# message types
+COMMAND = 0
+GET_WORKSPACES = 1
+SUBSCRIBE = 2
+GET_OUTPUTS = 3
+GET_TREE = 4
+GET_MARKS = 5
+GET_BAR_CONFIG = 6
+GET_VERSION = 7
+GET_BINDING_MODES = 8
+GET_CONFIG = 9
+SEND_TICK = 10
+GET_INPUTS = 100
+GET_SEATS = 101
+
+EVENT_TYPES = {
+    "workspace": 0,
+    "output": 1,
+    "mode": 2,
+    "window": 3,
+    "barconfig_update": 4,
+    "binding": 5,
+    "shutdown": 6,
+    "tick": 7,
+    "bar_state_update": 20,
+    "input": 21,
+}
+EVENT_NAMES = {code: name for name, code in EVENT_TYPES.items()}
+
+OUTPUT_WIDTH = 2560
+OUTPUT_HEIGHT = 1440
+BAR_HEIGHT = 30
+
+# (app_id, X11 class) of the windows of the synthetic tree
+APPS = [
+    ("firefox", None),
+    ("foot", None),
+    ("org.gnome.Nautilus", None),
+    (None, "Code"),
+    ("mpv", None),
+    ("thunderbird", None),
+    (None, "Slack"),
+    ("Alacritty", None),
+    ("org.telegram.desktop", None),
+    (None, "Gimp-2.10"),
+]
+
+KEYBOARDS = ["1:1:AT_Translated_Set_2_keyboard", "1133:49970:Logitech_Gaming_Keyboard_G110"]
+
+BINDINGS = [
+    "nop top_next",
+    "nop top_prev",
+    "nop sort-container",
+    "nop sort-container --key app_id",
+    "nop swaystack --push",
+]
+
+
+def rect(x: int = 0, y: int = 0, width: int = 0, height: int = 0) -> dict[str, int]:
+    return {"x": x, "y": y, "width": width, "height": height}
+
+
+def container(con_id: int, con_type: str, name: Optional[str], layout: str = "splith") -> dict[str, Any]:
+    return {
+        "id": con_id,
+        "type": con_type,
+        "orientation": "horizontal" if layout == "splith" else "vertical",
+        "percent": None,
+        "urgent": False,
+        "marks": [],
+        "focused": False,
+        "layout": layout,
+        "border": "none",
+        "current_border_width": 0,
+        "rect": rect(0, 0, OUTPUT_WIDTH, OUTPUT_HEIGHT),
+        "deco_rect": rect(),
+        "window_rect": rect(),
+        "geometry": rect(),
+        "name": name,
+        "window": None,
+        "nodes": [],
+        "floating_nodes": [],
+        "focus": [],
+        "fullscreen_mode": 0,
+        "sticky": False,
+    }
+
+
+def window(con_id: int, app_id: Optional[str], window_class: Optional[str], title: str) -> dict[str, Any]:
+    con = container(con_id, "con", title, "none")
+    con.update(
+        {
+            "orientation": "none",
+            "percent": 0.5,
+            "border": "normal",
+            "current_border_width": 2,
+            "deco_rect": rect(0, 0, 1280, 24),
+            "window_rect": rect(2, 24, 1276, 1384),
+            "geometry": rect(0, 0, 1276, 1384),
+            "pid": 1000 + con_id,
+            "app_id": app_id,
+            "visible": True,
+            "max_render_time": 0,
+            "shell": "xdg_shell" if app_id else "xwayland",
+            "inhibit_idle": False,
+            "idle_inhibitors": {"user": "none", "application": "none"},
+        }
+    )
+    if window_class is not None:
+        con["window"] = 0x1000000 + con_id
+        con["window_properties"] = {
+            "class": window_class,
+            "instance": window_class.lower(),
+            "title": title,
+            "transient_for": None,
+            "window_role": None,
+            "window_type": "normal",
+        }
+    return con
+
+
+def new_window(con_id: int, rng: random.Random) -> dict[str, Any]:
+    (app_id, window_class) = APPS[rng.randrange(len(APPS))]
+    return window(con_id, app_id, window_class, "%s %d" % (app_id or window_class, con_id))
+
+
+def synthetic_tree(workspaces: int, windows: int, seed: int = 0) -> dict[str, Any]:
+    """A tree of one output with workspaces 1..workspaces of windows each.
+
+    Half of the windows of a workspace are in a tabbed container, so the tree
+    has some depth, and the first window of workspace 1 is focused.
+    """
+    rng = random.Random(seed)
+    ids = itertools.count(10)
+    root = container(1, "root", "root")
+    scratch_output = container(2, "output", "__i3")
+    scratch_output["nodes"].append(container(3, "workspace", "__i3_scratch"))
+    output = container(4, "output", "eDP-1", "output")
+    output.update({"active": True, "primary": False, "make": "Fake", "model": "Sway", "serial": "0"})
+    root["nodes"] = [scratch_output, output]
+    for num in range(1, workspaces + 1):
+        workspace = container(next(ids), "workspace", str(num))
+        workspace.update({"num": num, "output": "eDP-1", "representation": None})
+        workspace["rect"] = rect(0, BAR_HEIGHT, OUTPUT_WIDTH, OUTPUT_HEIGHT - BAR_HEIGHT)
+        tabs = container(next(ids), "con", None, "tabbed")
+        for i in range(windows):
+            con = new_window(next(ids), rng)
+            (tabs if i < windows // 2 else workspace)["nodes"].append(con)
+        if tabs["nodes"]:
+            workspace["nodes"].insert(0, tabs)
+        output["nodes"].append(workspace)
+    first = next(iter(leaves(output)), None)
+    if first is not None:
+        first["focused"] = True
+    return root
+
+
+def walk(con: dict[str, Any], parent: Optional[dict[str, Any]] = None) -> Iterator[tuple[dict, Optional[dict]]]:
+    "(container, parent) for the container and all below it"
+    yield (con, parent)
+    for child in con["nodes"] + con["floating_nodes"]:
+        yield from walk(child, con)
+
+
+def leaves(con: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    return (c for (c, _) in walk(con) if c["type"] == "con" and not c["nodes"] and c["name"] is not None)
+
+
+def workspaces(tree: dict[str, Any]) -> list[dict[str, Any]]:
+    return [c for (c, _) in walk(tree) if c["type"] == "workspace" and not c["name"].startswith("__")]
+
+
+class Layout:
+    "the served tree, with an index of where every container is"
+
+    def __init__(self, tree: dict[str, Any]) -> None:
+        self.tree = tree
+        self.data: Optional[bytes] = None
+        self.reindex()
+
+    def reindex(self) -> None:
+        self.parents: dict[int, Optional[dict]] = {}
+        self.cons: dict[int, dict] = {}
+        for con, parent in walk(self.tree):
+            self.cons[con["id"]] = con
+            self.parents[con["id"]] = parent
+        self.data = None
+
+    def serialized(self) -> bytes:
+        # the tree only changes with events and renames, not on every request
+        if self.data is None:
+            self.data = json.dumps(self.tree).encode()
+        return self.data
+
+    def workspace_of(self, con_id: int) -> Optional[dict[str, Any]]:
+        con: Optional[dict] = self.cons.get(con_id)
+        while con is not None and con["type"] != "workspace":
+            con = self.parents.get(con["id"])
+        return con
+
+    def focused(self) -> Optional[dict[str, Any]]:
+        return next((con for con in self.cons.values() if con["focused"]), None)
+
+    def focus(self, con_id: int) -> None:
+        for con in self.cons.values():
+            con["focused"] = con["id"] == con_id
+        self.data = None
+
+    def remove(self, con_id: int) -> Optional[dict[str, Any]]:
+        parent = self.parents.get(con_id)
+        con = self.cons.get(con_id)
+        if parent is None or con is None:
+            return None
+        if con in parent["nodes"]:
+            parent["nodes"].remove(con)
+        else:
+            parent["floating_nodes"].remove(con)
+        self.reindex()
+        return con
+
+    def add(self, con: dict[str, Any], ws_id: int) -> None:
+        self.cons[ws_id]["nodes"].append(con)
+        self.reindex()
+
+    def workspace_list(self) -> list[dict[str, Any]]:
+        focused = self.focused()
+        focused_ws = self.workspace_of(focused["id"]) if focused is not None else None
+        return [
+            {
+                "id": ws["id"],
+                "num": ws.get("num", -1),
+                "name": ws["name"],
+                "visible": ws is focused_ws,
+                "focused": ws is focused_ws,
+                "urgent": False,
+                "rect": ws["rect"],
+                "output": "eDP-1",
+                "type": "workspace",
+                "layout": ws["layout"],
+                "representation": None,
+                "focus": [c["id"] for c in ws["nodes"]],
+            }
+            for ws in workspaces(self.tree)
+        ]
+
+    def rename_workspace(self, old: str, new: str) -> bool:
+        for ws in workspaces(self.tree):
+            if ws["name"] == old:
+                ws["name"] = new
+                num = new.split(":")[0]
+                ws["num"] = int(num) if num.isdigit() else -1
+                self.data = None
+                return True
+        return False
+
+
+def generate_trace(tree: dict[str, Any], count: int, seed: int = 0) -> list[dict[str, Any]]:
+    """A mix of the events of a working session, described by container id.
+
+    Mostly focus changes within and across workspaces, then title changes,
+    windows opening, closing and moving, bindings and keyboard layout
+    switches.
+    """
+    rng = random.Random(seed)
+    layout = Layout(copy.deepcopy(tree))
+    ids = itertools.count(max(layout.cons) + 1)
+    spaces = [ws["id"] for ws in workspaces(layout.tree)]
+    trace: list[dict[str, Any]] = []
+
+    def windows_on(ws_id: int) -> list[int]:
+        return [con["id"] for con in leaves(layout.cons[ws_id])]
+
+    def focus(con_id: int) -> None:
+        old = layout.focused()
+        old_ws = layout.workspace_of(old["id"]) if old is not None else None
+        new_ws = layout.workspace_of(con_id)
+        if new_ws is not None and new_ws is not old_ws:
+            trace.append({"type": "workspace", "change": "focus", "con": new_ws["id"]})
+        layout.focus(con_id)
+        trace.append({"type": "window", "change": "focus", "con": con_id})
+
+    while len(trace) < count:
+        current = layout.focused()
+        workspace = layout.workspace_of(current["id"]) if current is not None else None
+        ws_id = workspace["id"] if workspace is not None else spaces[0]
+        here = windows_on(ws_id)
+        roll = rng.random()
+        if roll < 0.45 and here:
+            focus(rng.choice(here))
+        elif roll < 0.55:
+            there = windows_on(rng.choice(spaces))
+            if there:
+                focus(rng.choice(there))
+        elif roll < 0.70 and current is not None:
+            current["name"] = "%s (%d)" % (current["name"].split(" (")[0], rng.randrange(100))
+            layout.data = None
+            trace.append({"type": "window", "change": "title", "con": current["id"], "name": current["name"]})
+        elif roll < 0.78:
+            con = new_window(next(ids), rng)
+            layout.add(con, ws_id)
+            trace.append({"type": "window", "change": "new", "con": con["id"], "workspace": ws_id, "window": con})
+            focus(con["id"])
+        elif roll < 0.85 and len(here) > 1 and current is not None:
+            layout.remove(current["id"])
+            trace.append({"type": "window", "change": "close", "con": current["id"]})
+            focus(rng.choice(windows_on(ws_id)))
+        elif roll < 0.89 and len(here) > 1 and current is not None:
+            dest = rng.choice(spaces)
+            moved = layout.remove(current["id"])
+            if moved is not None:
+                layout.add(moved, dest)
+                trace.append({"type": "window", "change": "move", "con": moved["id"], "workspace": dest})
+                focus(rng.choice(windows_on(ws_id)))
+        elif roll < 0.96:
+            trace.append({"type": "binding", "command": rng.choice(BINDINGS)})
+        else:
+            trace.append({"type": "input", "change": "xkb_layout", "keyboard": rng.randrange(len(KEYBOARDS)),
+                          "layout": rng.randrange(2)})
+    return trace[:count]
+
+
+def load_trace(path: str) -> tuple[Optional[dict[str, Any]], list[dict[str, Any]]]:
+    tree = None
+    events = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "tree" in entry:
+                tree = entry["tree"]
+            else:
+                events.append(entry)
+    return (tree, events)
+
+
+def input_device(identifier: str, layout_index: int) -> dict[str, Any]:
+    return {
+        "identifier": identifier,
+        "name": identifier.split(":")[-1].replace("_", " "),
+        "vendor": int(identifier.split(":")[0]),
+        "product": int(identifier.split(":")[1]),
+        "type": "keyboard",
+        "xkb_active_layout_name": ["English (US)", "German"][layout_index],
+        "xkb_layout_names": ["English (US)", "German"],
+        "xkb_active_layout_index": layout_index,
+    }
+
+
+class Client:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.lock = threading.Lock()  # replies and events may be sent from different threads
+        self.events: set[str] = set()
+
+    def send(self, message_type: int, payload: bytes) -> None:
+        with self.lock:
+            self.sock.sendall(MAGIC + struct.pack("=II", len(payload), message_type) + payload)
+
+
+class FakeSway:
+    """Serves sway IPC requests on a Unix socket and sends events to subscribers.
+
+    Every request is counted in `requests`, commands are also kept in
+    `commands` with the time they arrived.
+    """
+
+    def __init__(self, path: str, tree: dict[str, Any]) -> None:
+        self.path = path
+        self.layout = Layout(tree)
+        self.lock = threading.Lock()
+        self.clients: list[Client] = []
+        self.requests = 0
+        self.commands: list[tuple[float, str]] = []
+        self.inputs = [input_device(identifier, 0) for identifier in KEYBOARDS]
+        self.subscribed = threading.Event()
+        self.server: Optional[socket.socket] = None
+
+    def start(self) -> "FakeSway":
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(16)
+        threading.Thread(target=self.accept, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        "close all connections, scripts see sway going away"
+        if self.server is not None:
+            self.server.close()
+        for client in list(self.clients):
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def close_subscriptions(self) -> None:
+        "end the event streams, so the scripts' main loops return"
+        for client in list(self.clients):
+            if client.events:
+                client.sock.shutdown(socket.SHUT_RDWR)
+
+    def subscriptions(self) -> set[str]:
+        return set().union(*(client.events for client in self.clients))
+
+    def accept(self) -> None:
+        assert self.server is not None
+        while True:
+            try:
+                (sock, _) = self.server.accept()
+            except OSError:
+                return
+            client = Client(sock)
+            self.clients.append(client)
+            threading.Thread(target=self.serve, args=(client,), daemon=True).start()
+
+    def serve(self, client: Client) -> None:
+        try:
+            while True:
+                (_, length, message_type) = struct.unpack(HEADER, self.receive(client.sock, HEADER_SIZE))
+                payload = self.receive(client.sock, length).decode()
+                with self.lock:
+                    self.requests += 1
+                    reply = self.handle(client, message_type, payload)
+                client.send(message_type, reply)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    @staticmethod
+    def receive(sock: socket.socket, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client went away")
+            data += chunk
+        return data
+
+    def handle(self, client: Client, message_type: int, payload: str) -> bytes:
+        if message_type == GET_TREE:
+            return self.layout.serialized()
+        if message_type == COMMAND:
+            self.commands.append((time.monotonic(), payload))
+            return json.dumps([self.run_command(c) for c in split_commands(payload)]).encode()
+        if message_type == SUBSCRIBE:
+            client.events.update(json.loads(payload))
+            self.subscribed.set()
+            return b'{"success": true}'
+        if message_type == GET_WORKSPACES:
+            return json.dumps(self.layout.workspace_list()).encode()
+        if message_type == GET_OUTPUTS:
+            output = self.layout.tree["nodes"][1]
+            return json.dumps([{**output, "nodes": [], "current_workspace": None}]).encode()
+        if message_type == GET_VERSION:
+            return json.dumps(
+                {"major": 1, "minor": 10, "patch": 0, "human_readable": "1.10-fake", "loaded_config_file_name": ""}
+            ).encode()
+        if message_type == GET_INPUTS:
+            return json.dumps(self.inputs).encode()
+        if message_type == GET_CONFIG:
+            return b'{"config": ""}'
+        if message_type == SEND_TICK:
+            self.emit("tick", {"first": False, "payload": payload})
+            return b'{"success": true}'
+        return b"[]"
+
+    def run_command(self, command: str) -> dict[str, Any]:
+        words = shlex.split(command)
+        if words[:2] == ["rename", "workspace"] and len(words) == 5 and words[3] == "to":
+            self.layout.rename_workspace(words[2], words[4])
+        elif words and words[0].startswith("[con_id=") and words[1:] == ["focus"]:
+            self.layout.focus(int(words[0][len("[con_id="):-1].strip('"')))
+        return {"success": True}
+
+    def event(self, entry: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+        "apply a trace entry to the tree and return the event to send"
+        event_type = entry["type"]
+        if "payload" in entry:
+            payload = entry["payload"]
+            if event_type == "window":
+                # where new and moved windows went is not in the event
+                con = self.layout.cons.get(payload["container"]["id"])
+                if con is not None and payload["change"] == "focus":
+                    self.layout.focus(con["id"])
+                elif con is not None and payload["change"] == "title":
+                    con["name"] = payload["container"]["name"]
+                    self.layout.data = None
+                elif con is not None and payload["change"] == "close":
+                    self.layout.remove(con["id"])
+            return (event_type, payload)
+
+        layout = self.layout
+        change = entry.get("change")
+        if event_type == "window":
+            if change == "new":
+                layout.add(copy.deepcopy(entry["window"]), entry["workspace"])
+            con = layout.cons.get(entry["con"]) or {"id": entry["con"]}
+            if change == "focus":
+                layout.focus(entry["con"])
+            elif change == "title":
+                con["name"] = entry["name"]
+                layout.data = None
+            elif change == "close":
+                layout.remove(entry["con"])
+            elif change == "move":
+                moved = layout.remove(entry["con"])
+                if moved is not None:
+                    layout.add(moved, entry["workspace"])
+            return ("window", {"change": change, "container": con})
+        if event_type == "workspace":
+            focused = layout.focused()
+            old = layout.workspace_of(focused["id"]) if focused is not None else None
+            return ("workspace", {"change": change, "current": layout.cons.get(entry["con"]), "old": old})
+        if event_type == "binding":
+            binding = {"command": entry["command"], "event_state_mask": ["Mod4"], "input_code": 0,
+                       "symbol": "x", "input_type": "keyboard"}
+            return ("binding", {"change": "run", "binding": binding})
+        if event_type == "input":
+            device = self.inputs[entry["keyboard"]] = input_device(KEYBOARDS[entry["keyboard"]], entry["layout"])
+            return ("input", {"change": change, "input": device})
+        return (event_type, {k: v for k, v in entry.items() if k != "type"})
+
+    def emit(self, event_type: str, payload: dict[str, Any]) -> int:
+        "send an event to its subscribers, return how many there were"
+        data = json.dumps(payload).encode()
+        sent = 0
+        for client in list(self.clients):
+            if event_type in client.events:
+                try:
+                    client.send(0x80000000 | EVENT_TYPES[event_type], data)
+                    sent += 1
+                except OSError:
+                    pass
+        return sent
+
+    def play(self, entry: dict[str, Any]) -> int:
+        with self.lock:
+            (event_type, payload) = self.event(entry)
+        return self.emit(event_type, payload)
+
+
+def split_commands(payload: str) -> list[str]:
+    "split a command message at the ; and , that are not quoted"
+    commands = []
+    current = ""
+    quote = None
+    for char in payload:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in ";,":
+            commands.append(current.strip())
+            current = ""
+            continue
+        current += char
+    commands.append(current.strip())
+    return [command for command in commands if command]
+
+
+def capture(path: str, duration: Optional[float]) -> None:
+    "record the tree and the events of the running sway into a trace file"
+    socket_path = os.environ.get("SWAYSOCK") or os.environ.get("I3SOCK")
+    if not socket_path:
+        sys.exit("SWAYSOCK is not set, is sway running?")
+
+    def request(sock: socket.socket, message_type: int, payload: str = "") -> bytes:
+        data = payload.encode()
+        sock.sendall(MAGIC + struct.pack("=II", len(data), message_type) + data)
+        (_, length, _) = struct.unpack(HEADER, FakeSway.receive(sock, HEADER_SIZE))
+        return FakeSway.receive(sock, length)
+
+    with socket.socket(socket.AF_UNIX) as sock, open(path, "w") as out:
+        sock.connect(socket_path)
+        out.write(json.dumps({"tree": json.loads(request(sock, GET_TREE))}) + "\n")
+        request(sock, SUBSCRIBE, json.dumps(["window", "workspace", "binding", "input"]))
+        if duration:
+            sock.settimeout(duration)
+        start = time.monotonic()
+        try:
+            while True:
+                (_, length, message_type) = struct.unpack(HEADER, FakeSway.receive(sock, HEADER_SIZE))
+                payload = json.loads(FakeSway.receive(sock, length))
+                event_type = EVENT_NAMES.get(message_type & 0x7FFFFFFF, "unknown")
+                out.write(json.dumps({"type": event_type, "time": time.monotonic() - start, "payload": payload}) + "\n")
+                if duration and time.monotonic() - start > duration:
+                    break
+        except (KeyboardInterrupt, socket.timeout):
+            pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake sway IPC socket and replay events on it.")
+    parser.add_argument("--socket", default="/tmp/fakesway.sock", help="path of the socket to serve")
+    parser.add_argument("--workspaces", type=int, default=10, help="number of workspaces of the synthetic tree")
+    parser.add_argument("--windows", type=int, default=10, help="number of windows per workspace")
+    parser.add_argument("--events", type=int, default=0, help="number of events to generate and replay")
+    parser.add_argument("--trace", help="replay this trace file instead of generated events")
+    parser.add_argument("--rate", type=float, default=50.0, help="events per second to replay at")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the tree and the generated events")
+    parser.add_argument("--record", help="write the commands received to this file")
+    parser.add_argument("--capture", metavar="TRACE", help="record a trace on the running sway instead")
+    parser.add_argument("--duration", type=float, help="stop capturing after this many seconds")
+    args = parser.parse_args()
+
+    if args.capture:
+        capture(args.capture, args.duration)
+        return
+
+    tree = synthetic_tree(args.workspaces, args.windows, args.seed)
+    events: list[dict[str, Any]] = []
+    if args.trace:
+        (trace_tree, events) = load_trace(args.trace)
+        tree = trace_tree or tree
+    elif args.events:
+        events = generate_trace(tree, args.events, args.seed)
+
+    sway = FakeSway(args.socket, tree).start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"serving on {args.socket}", file=sys.stderr)
+    try:
+        if events:
+            sway.subscribed.wait()
+            time.sleep(0.5)  # let the script finish starting up
+            for entry in events:
+                sway.play(entry)
+                time.sleep(1 / args.rate)
+            print(f"replayed {len(events)} events, received {sway.requests} requests", file=sys.stderr)
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sway.stop()
+        if args.record:
+            with open(args.record, "w") as f:
+                for (when, command) in sway.commands:
+                    f.write(f"{when:.6f}\t{command}\n")
+
+
+if __name__ == "__main__":
+    main()
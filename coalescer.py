@@ -0,0 +1,60 @@
+# Coalescing of bursts of events, for the scripts in this repository that are
+# run with --coalesce.
+#
+# Moving a workspace or restoring a session makes sway send an event for
+# every window involved, and a script reacting to each one of them redoes the
+# same work over and over. A Coalescer collects the events instead and hands
+# the whole burst to the script once it is over, so the work is done once,
+# against the final state.
+
+import time
+from threading import Lock, Timer
+from typing import Any, Callable, Optional
+
+
+class Coalescer:
+    """Collects events and hands them to flush() in one batch.
+
+    The batch is flushed once no event arrived for `quiet` seconds, or at the
+    latest `max_delay` seconds after its first event. flush() runs in a timer
+    thread with `lock` held.
+    """
+
+    def __init__(self, flush: Callable[[list[Any]], None], quiet: float, max_delay: float) -> None:
+        self.flush = flush
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.lock = Lock()
+        self.events: list[Any] = []
+        self.deadline = 0.0
+        self.timer: Optional[Timer] = None
+        self.received = 0
+        self.folded = 0  # events handled in the batch of an earlier event
+
+    def push(self, event: Any) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if not self.events:
+                self.deadline = now + self.max_delay
+            self.events.append(event)
+            self.received += 1
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = Timer(max(0.0, min(self.quiet, self.deadline - now)), self.run)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def run(self) -> None:
+        with self.lock:
+            events, self.events = self.events, []
+            if not events:
+                return
+            self.folded += len(events) - 1
+            self.flush(events)
+
+    def stop(self) -> None:
+        "drop the events not flushed yet, must not be called from a signal handler"
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.events = []
@@ -17,36 +17,134 @@ of any other programs that this functionality would benefit.
 """
 
 import argparse
+import json
 import logging
+import os
+import re
 import signal
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Callable, Optional, Union
 
 import i3ipc
 
 logger = logging.getLogger(__name__)
 
 
+# keys indexed on, with an exact value they let most events be rejected without
+# looking at any rule
+INDEX_KEYS = ("app_id", "class")
+# keys that can change on a window::title event
+TITLE_KEYS = {"name", "title"}
+
+
+def container_value(data: dict[str, Any], key: str) -> Optional[str]:
+    "look up a rule key in container ipc data, X11 window properties included"
+    if key in data:
+        return data[key]
+    return data.get("window_properties", {}).get(key)
+
+
 @dataclass(slots=True)
 class Watch:
-    container_props: dict[str,str]
+    container_props: dict[str, Union[str, re.Pattern[str]]]
     binds: set[str]
 
+    def matches(self, data: dict[str, Any]) -> bool:
+        for k, v in self.container_props.items():
+            value = container_value(data, k)
+            if isinstance(v, str):
+                if value != v:
+                    return False
+            elif value is None or not v.fullmatch(value):
+                return False
+        return True
+
+    def uses_title(self) -> bool:
+        return not TITLE_KEYS.isdisjoint(self.container_props)
+
 
 class Monitor:
     _bound: set[str]
     watched: list[Watch]
+    # (key, exact value) -> watches requiring that value
+    _index: dict[tuple[str, str], list[Watch]]
+    # watches without an exact app_id/class, checked on every event
+    _unindexed: list[Watch]
 
-    def __init__(self) -> None:
-        self.ipc = i3ipc.Connection()
+    def __init__(self, ipc: i3ipc.Connection) -> None:
+        self.ipc = ipc
         self.ipc.on("window::focus", self.on_window_event)
         # firefox creates PIP window without title, so need to watch for changes
         self.ipc.on("window::title", self.on_window_event)
         self._bound = set()
         self.watched = []
+        self._index = defaultdict(list)
+        self._unindexed = []
+
+    def bind(self, *binds: str, **props: Union[str, re.Pattern[str]]) -> None:
+        watch = Watch(props, set(binds))
+        self.watched.append(watch)
+        for key in INDEX_KEYS:
+            value = props.get(key)
+            if isinstance(value, str):
+                self._index[key, value].append(watch)
+                break
+        else:
+            self._unindexed.append(watch)
+
+    def load_config(self, path: str) -> None:
+        """load rules from a JSON file
+
+        The file holds a list of rules like
+        {"binds": ["Escape", "Ctrl+q"], "app_id": "firefox", "name": "Picture-in-Picture"},
+        where every other key is a container property (app_id, name, class,
+        instance, ...) and its value the exact value the property must have.
+        Properties under "regex", as in {"regex": {"name": "Picture-in-.*"}},
+        are regular expressions that have to match the whole property instead.
 
-    def bind(self, *binds: str, **props: str) -> None:
-        self.watched.append(Watch(props, set(binds)))
+        Raises ValueError for a rule that is not of this form.
+        """
+        with open(path) as f:
+            try:
+                rules = json.load(f)
+            except ValueError as e:
+                raise ValueError(f"{path}: {e}") from None
+        if not isinstance(rules, list):
+            raise ValueError(f"{path}: expected a list of rules")
+        for i, rule in enumerate(rules, 1):
+            if not isinstance(rule, dict):
+                raise ValueError(f"{path}: rule {i} is not an object")
+            rule = dict(rule)
+            binds = rule.pop("binds", None)
+            if not isinstance(binds, list) or not binds or not all(isinstance(b, str) for b in binds):
+                raise ValueError(f'{path}: rule {i} needs "binds", a list of key names')
+            patterns = rule.pop("regex", {})
+            if not isinstance(patterns, dict):
+                raise ValueError(f'{path}: "regex" of rule {i} is not an object')
+            props: dict[str, Union[str, re.Pattern[str]]] = {}
+            for k, v in rule.items():
+                if not isinstance(v, str):
+                    raise ValueError(f"{path}: {k} of rule {i} is not a string")
+                # exact values can be indexed
+                props[k] = v
+            for k, v in patterns.items():
+                if not isinstance(v, str):
+                    raise ValueError(f"{path}: regex {k} of rule {i} is not a string")
+                try:
+                    props[k] = re.compile(v)
+                except re.error as e:
+                    raise ValueError(f"{path}: regex {k} of rule {i}: {e}") from None
+            self.bind(*binds, **props)
+
+    def candidates(self, data: dict[str, Any]) -> list[Watch]:
+        "watches that could match the container, found via the index"
+        found = list(self._unindexed)
+        for key in INDEX_KEYS:
+            value = container_value(data, key)
+            if value is not None:
+                found.extend(self._index.get((key, value), ()))
+        return found
 
     def run(self) -> None:
         "run main i3ipc event loop"
@@ -56,14 +154,17 @@ class Monitor:
             ipc.main_quit()
 
         # stop event loop when we get one of these
-        for sig in signal.SIGINT, signal.SIGTERM:
+        for sig in signal.SIGINT, signal.SIGTERM, signal.SIGHUP:
             signal.signal(sig, sighandler)
 
         try:
             ipc.main()
         finally:
-            # clean up
-            self.bound = set()
+            self.cleanup()
+
+    def cleanup(self) -> None:
+        "remove our binds"
+        self.bound = set()
 
     def on_window_event(self, ipc: i3ipc.Connection, event: i3ipc.WindowEvent) -> None:
         "respond to window events"
@@ -71,11 +172,15 @@ class Monitor:
         if not container.focused:
             return
         data = container.ipc_data
+        watches = self.candidates(data)
+        if event.change == "title" and not any(watch.uses_title() for watch in watches):
+            # a title change can only matter to rules that look at the title
+            return
         logger.debug("window event %s", data)
         binds = set()
-        for watch in self.watched:
-            if all(data.get(k) == v for k, v in watch.container_props.items()):
-                    binds.update(watch.binds)
+        for watch in watches:
+            if watch.matches(data):
+                binds.update(watch.binds)
 
         self.bound = binds
 
@@ -93,22 +198,44 @@ class Monitor:
             logger.info(f"removing binds {', '.join(to_del)}")
         if to_add:
             logger.info(f"adding binds {', '.join(to_add)}")
-        for bind in to_del:
-            self.ipc.command(f"unbindsym {bind}")
+        changed = [*to_del, *to_add]
+        commands = [f"unbindsym {bind}" for bind in to_del]
         for bind in to_add:
             msg = f"{bind} ignored due to focus monitor"
-            self.ipc.command(f"bindsym {bind} exec echo '{msg}'")
-        self._bound = binds
+            commands.append(f"bindsym {bind} exec echo '{msg}'")
+        # one message for the whole transition, so no key can slip through
+        # to the wrong window between individual commands
+        replies = self.ipc.command("; ".join(commands))
+        failed = set()
+        for i, bind in enumerate(changed):
+            # sway stops at a failing command, the binds after it got no reply
+            if i >= len(replies):
+                logger.error(f"could not update bind {bind}: an earlier command failed")
+                failed.add(bind)
+            elif not replies[i].success:
+                logger.error(f"could not update bind {bind}: {replies[i].error}")
+                failed.add(bind)
+        # a bind that failed to be added is not bound, one that failed to be
+        # removed still is, and is removed again on the next transition
+        self._bound = (binds - (failed & to_add)) | (failed & to_del)
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="track active window to disable Esc key in Firefox popout media player",
     )
     parser.add_argument(
         "--verbose", "-v", help="Increase verbosity", action="store_true"
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--config",
+        "-c",
+        help="JSON file with rules, replaces the built-in Firefox rule",
+        default=os.path.join(
+            os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), "sway", "focus-monitor.json"
+        ),
+    )
+    args = parser.parse_args(argv)
     args.loglevel = logging.DEBUG if args.verbose else logging.INFO
     return args
 
@@ -116,6 +243,21 @@ def parse_args() -> argparse.Namespace:
 KEY_ESCAPE = "Escape"
 
 
+def create_monitor(ipc: i3ipc.Connection, args: argparse.Namespace) -> Monitor:
+    mon = Monitor(ipc)
+    if os.path.exists(args.config):
+        mon.load_config(args.config)
+    else:
+        # block Escape key from reaching Firefox's popout window
+        mon.bind(KEY_ESCAPE, app_id="firefox", name="Picture-in-Picture")
+    return mon
+
+
+def setup(ipc: i3ipc.Connection, args: argparse.Namespace) -> Callable[[], None]:
+    "create the monitor on ipc, return the function that removes its binds"
+    return create_monitor(ipc, args).cleanup
+
+
 def main() -> None:
     args = parse_args()
     logging.basicConfig(
@@ -123,9 +265,12 @@ def main() -> None:
         format="%(asctime)s %(levelname)s %(message)s",
     )
 
-    mon = Monitor()
-    # block Escape key from reaching Firefox's popout window
-    mon.bind(KEY_ESCAPE, app_id="firefox", name="Picture-in-Picture")
+    ipc = i3ipc.Connection()
+    try:
+        mon = create_monitor(ipc, args)
+    except (OSError, ValueError) as e:
+        logger.error(f"could not load rules: {e}")
+        raise SystemExit(1) from None
     mon.run()
 
 
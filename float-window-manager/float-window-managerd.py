@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+# Python version of float-window-managerd.sh: remembers where floating windows
+# were placed and puts them there again the next time they appear.
+#
+# It subscribes to window events directly instead of spawning swaymsg/jq per
+# event, keeps the positions in memory, indexed by window title and app_id,
+# and writes them in batches to a single file
+# ($HOME/.config/sway/float_window_store.json). Positions saved by the shell
+# version in $HOME/.config/sway/float_window_store/ are read at startup, and
+# with --mirror-store-dir new positions are also written there, so both
+# versions can be used with the same data.
+#
+# This script requires i3ipc-python package (install it from a system package
+# manager or pip) and sway 1.6 or later.
+#
+# Example sway config:
+#
+# exec /path/to/float-window-managerd.py
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+from dataclasses import dataclass
+from threading import Lock, Timer
+from typing import Any, Optional
+
+import i3ipc
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".config", "sway")
+
+
+@dataclass(slots=True)
+class Tracked:
+    "a floating window we watch, with what is needed to save its position"
+    x: int
+    y: int
+    output: i3ipc.Rect
+    ws_x: int
+    ws_y: int
+    deco_height: int
+    was_tiling: bool
+    ignore: bool
+
+
+class PositionStore:
+    """Window positions in percent of the output, indexed by title and app_id.
+
+    A position of None means "ignore this window". Changes are written to the
+    store file at most once per flush interval.
+    """
+
+    def __init__(self, path: str, store_dir: str, mirror: bool, flush_interval: float) -> None:
+        self.path = path
+        self.store_dir = store_dir
+        self.mirror = mirror
+        self.flush_interval = flush_interval
+        self.positions: dict[str, Optional[tuple[int, int]]] = {}
+        self.app_ids: dict[str, str] = {}  # app_id -> title of its latest position
+        self.titles_of: dict[str, Optional[str]] = {}  # title -> app_id
+        self.changed: set[str] = set()
+        self.lock = Lock()
+        self.timer: Optional[Timer] = None
+
+    def load(self) -> None:
+        "read the shell version's store directory, then the store file"
+        for filename in sorted(os.listdir(self.store_dir)) if os.path.isdir(self.store_dir) else []:
+            try:
+                with open(os.path.join(self.store_dir, filename)) as f:
+                    fields = f.read().split()
+            except OSError as e:
+                logger.warning("could not read %s: %s", filename, e)
+                continue
+            if not fields:
+                self.positions[filename] = None
+            elif len(fields) == 2 and all(v.lstrip("+-").isdigit() for v in fields):
+                self.positions[filename] = (int(fields[0]), int(fields[1]))
+            else:
+                logger.warning("window %r has an invalid position, ignoring", filename)
+
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        for title, entry in entries.items():
+            if entry is None:
+                self.positions[title] = None
+                continue
+            (x, y, app_id) = entry
+            self.positions[title] = (x, y)
+            self.titles_of[title] = app_id
+            if app_id:
+                self.app_ids[app_id] = title
+
+    def lookup(self, title: Optional[str], app_id: Optional[str]) -> tuple[bool, Optional[tuple[int, int]]]:
+        "return whether there is an entry for the window, and its position"
+        if title in self.positions:
+            return (True, self.positions[title])
+        if app_id in self.app_ids:
+            return (True, self.positions.get(self.app_ids[app_id]))
+        return (False, None)
+
+    def save(self, title: str, app_id: Optional[str], position: tuple[int, int]) -> None:
+        with self.lock:
+            self.positions[title] = position
+            self.titles_of[title] = app_id
+            if app_id:
+                self.app_ids[app_id] = title
+            self.changed.add(title)
+            if self.timer is None:
+                self.timer = Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> None:
+        with self.lock:
+            self.timer = None
+            changed, self.changed = self.changed, set()
+            entries = {
+                title: None if pos is None else [pos[0], pos[1], self.titles_of.get(title)]
+                for title, pos in self.positions.items()
+            }
+        if not changed:
+            return
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("could not write %s: %s", self.path, e)
+        if self.mirror:
+            os.makedirs(self.store_dir, exist_ok=True)
+            for title in changed:
+                pos = entries[title]
+                if "/" in title or not title or pos is None:
+                    continue
+                try:
+                    with open(os.path.join(self.store_dir, title), "w") as f:
+                        f.write(f"{pos[0]} {pos[1]}\n")
+                except OSError as e:
+                    logger.error("could not write position of %r: %s", title, e)
+
+
+def title_criteria(title: str) -> str:
+    # criteria values are regular expressions inside double quotes
+    escaped = "".join("\\" + c if not c.isalnum() and c != " " else c for c in title)
+    return f'[title="{escaped}"]'
+
+
+class FloatWindowManager:
+    def __init__(self, ipc: i3ipc.Connection, store: PositionStore) -> None:
+        self.ipc = ipc
+        self.store = store
+        self.tracked: dict[int, Tracked] = {}
+        ipc.on(i3ipc.Event.WINDOW_NEW, self.on_new)
+        ipc.on(i3ipc.Event.WINDOW_FLOATING, self.on_floating)
+        ipc.on(i3ipc.Event.WINDOW_CLOSE, self.on_close)
+
+    def add_rules(self) -> None:
+        "make sway place new windows itself, with one for_window rule per title"
+        self.send_rules([
+            (title, pos)
+            for title, pos in self.store.positions.items()
+            if pos is not None and title and 0 <= pos[0] <= 100 and 0 <= pos[1] <= 100
+        ])
+
+    def send_rules(self, rules: list[tuple[str, tuple[int, int]]]) -> None:
+        "add for_window rules for (title, position), logging those that fail"
+        while rules:
+            replies = self.ipc.command("; ".join(
+                f"for_window {title_criteria(title)} move position {pos[0]} ppt {pos[1]} ppt"
+                for (title, pos) in rules
+            ))
+            for (title, _), reply in zip(rules, replies, strict=False):
+                if not reply.success:
+                    logger.error("could not add the rule for window %r: %s", title, reply.error)
+            if not replies:
+                for title, _ in rules:
+                    logger.error("could not add the rule for window %r: no reply", title)
+                return
+            # sway stops at a failing command, the rules after it are sent again
+            rules = rules[len(replies):]
+
+    def track(self, con_id: int, was_tiling: bool) -> Optional[i3ipc.Con]:
+        con = self.ipc.get_tree().find_by_id(con_id)
+        if con is None or con.type != "floating_con":
+            return None
+        workspace = con.workspace()
+        output = workspace.parent if workspace is not None else None
+        if workspace is None or output is None:
+            return None
+        self.tracked[con.id] = Tracked(
+            x=con.rect.x,
+            y=con.rect.y,
+            output=output.rect,
+            ws_x=workspace.rect.x,
+            ws_y=workspace.rect.y,
+            deco_height=con.deco_rect.height if con.deco_rect else 0,
+            was_tiling=was_tiling,
+            ignore=False,
+        )
+        return con
+
+    def restore(self, con: i3ipc.Con, moved_by_sway: bool) -> None:
+        known, position = self.store.lookup(con.name, con.app_id)
+        tracked = self.tracked[con.id]
+        if not known:
+            return
+        if position is None:
+            logger.info("position of window %r ignored", con.name)
+            tracked.ignore = True
+            return
+        if moved_by_sway and con.name in self.store.positions:
+            # the for_window rule already placed it
+            return
+        self.ipc.command(f"[con_id={con.id}] move position {position[0]} ppt {position[1]} ppt")
+        moved = self.ipc.get_tree().find_by_id(con.id)
+        if moved is not None:
+            (tracked.x, tracked.y) = (moved.rect.x, moved.rect.y)
+
+    def on_new(self, _ipc: i3ipc.Connection, event: i3ipc.WindowEvent) -> None:
+        con = self.track(event.container.id, was_tiling=False)
+        if con is not None:
+            self.restore(con, moved_by_sway=True)
+
+    def on_floating(self, _ipc: i3ipc.Connection, event: i3ipc.WindowEvent) -> None:
+        con_id = event.container.id
+        if event.container.type == "floating_con":
+            if con_id in self.tracked:
+                return
+            con = self.track(con_id, was_tiling=True)
+            if con is not None:
+                self.restore(con, moved_by_sway=False)
+        else:
+            self.save(event.container)
+
+    def on_close(self, _ipc: i3ipc.Connection, event: i3ipc.WindowEvent) -> None:
+        tracked = self.tracked.get(event.container.id)
+        if tracked is None:
+            return
+        if event.container.type == "floating_con" or tracked.was_tiling:
+            self.save(event.container, add_rule=not tracked.was_tiling)
+        self.tracked.pop(event.container.id, None)
+
+    def save(self, con: i3ipc.Con, add_rule: bool = False) -> None:
+        tracked = self.tracked.pop(con.id, None)
+        if tracked is None or tracked.ignore or not con.name:
+            return
+        (x, y) = (con.rect.x - tracked.output.x, con.rect.y - tracked.output.y)
+        if (con.rect.x, con.rect.y) == (tracked.x, tracked.y):
+            return
+        if not (0 <= x < tracked.output.width and 0 <= y < tracked.output.height):
+            logger.info("window %r is off-screen, not saving", con.name)
+            return
+
+        # same formula as the shell version, relative to the window's output
+        width = tracked.output.width - (tracked.ws_x - tracked.output.x)
+        height = tracked.output.height - (tracked.ws_y - tracked.output.y) - tracked.deco_height
+        position = (round(x / width * 100), round(y / height * 100))
+        logger.info("window %r position saved: %d %d", con.name, *position)
+        self.store.save(con.name, con.app_id, position)
+        if add_rule:
+            self.send_rules([(con.name, position)])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Remember the positions of floating windows.")
+    parser.add_argument(
+        "--store",
+        default=os.path.join(CONFIG_DIR, "float_window_store.json"),
+        help="file to keep window positions in",
+    )
+    parser.add_argument(
+        "--store-dir",
+        default=os.path.join(CONFIG_DIR, "float_window_store"),
+        help="directory of the shell version's per-window files, read at startup",
+    )
+    parser.add_argument(
+        "--mirror-store-dir",
+        action="store_true",
+        help="also write new positions to --store-dir, for the shell version",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=10.0,
+        help="seconds to batch position changes before writing them",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Increase verbosity")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+    ipc = i3ipc.Connection()
+    version = ipc.get_version()
+    if (version.major, version.minor) < (1, 6):
+        logger.error("sway %s does not support moving windows with percentages, 1.6 is needed",
+                     version.human_readable)
+        sys.exit(1)
+
+    os.makedirs(os.path.dirname(args.store), exist_ok=True)
+    store = PositionStore(args.store, args.store_dir, args.mirror_store_dir, args.flush_interval)
+    store.load()
+    manager = FloatWindowManager(ipc, store)
+    manager.add_rules()
+
+    def sighandler(signum: int, frame: Any) -> None:
+        ipc.main_quit()
+
+    for sig in signal.SIGINT, signal.SIGTERM:
+        signal.signal(sig, sighandler)
+
+    try:
+        ipc.main()
+    finally:
+        store.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 _grimpicker() {
 	local cur="${COMP_WORDS[COMP_CWORD]}"
 
-	short=(-p -d -e -c -n -h -v)
-	long=(--print --draw --escape --copy --notify --help --version)
+	short=(-p -d -e -c -n -r -P -s -h -v)
+	long=(--print --draw --escape --copy --notify --region --palette --samples --session --help --version)
 
 	if [[ $cur == --* ]]; then
 		COMPREPLY=($(compgen -W "${long[*]}" -- "$cur"))
@@ -4,5 +4,9 @@ complete -c grimpicker -s d -l draw -d "Draw a colored block"
 complete -c grimpicker -s e -l escape -d "Print shell escape sequences"
 complete -c grimpicker -s c -l copy -d "Copy to clipboard"
 complete -c grimpicker -s n -l notify -d "Send a notification"
+complete -c grimpicker -s r -l region -d "Pick the mean color of a region"
+complete -c grimpicker -s P -l palette -x -d "Extract a palette of N dominant colors from a region"
+complete -c grimpicker -l samples -x -d "Pixels to sample for --palette"
+complete -c grimpicker -s s -l session -d "Pick several colors from one capture"
 complete -c grimpicker -s h -l help -d "Show help message and quit"
 complete -c grimpicker -s v -l version -d "Show version number and quit"
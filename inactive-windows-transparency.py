@@ -8,49 +8,251 @@
 import argparse
 import signal
 import sys
+import time
 from functools import partial
+from threading import Lock, Timer
 
 import i3ipc
 
+# container fields used with --lean-tree
+TREE_FIELDS = ("app_id", "window_class", "focused")
 
-def on_window(args, ipc, event):
-    global focused_set
 
-    # To get the workspace for a container, we need to have received its
-    # parents, so fetch the whole tree
-    tree = ipc.get_tree()
+def views(con):
+    return [c for c in con.descendants() if c.app_id is not None or c.window_class is not None]
 
-    focused = tree.find_focused()
-    if focused is None:
+
+class ShadowTree:
+    """Container id -> workspace mapping kept up to date from events.
+
+    Only the workspace of each container and which containers are opaque is
+    needed, so the tree is fetched once at startup and again only on reload or
+    when the mapping turns out to be incomplete.
+    """
+
+    def __init__(self, ipc, lean_tree=False):
+        self.ipc = ipc
+        self.lean_tree = lean_tree
+        self.con_to_ws = {}  # container id -> workspace id
+        self.focused_ws = None  # focused workspace id
+        self.focused_set = set()  # ids of containers that are (possibly) opaque
+        self.stale = False
+        self.ipc_messages = 0  # number of requests sent to sway, see --stats
+
+    def get_tree(self):
+        self.ipc_messages += 1
+        if self.lean_tree:
+            import swaytree
+
+            return swaytree.get_tree(self.ipc, TREE_FIELDS)
+        return self.ipc.get_tree()
+
+    def set_opacity(self, opacities):
+        """Apply {container id: opacity} in a single IPC message."""
+        if not opacities:
+            return
+        self.ipc_messages += 1
+        self.ipc.command(
+            "; ".join("[con_id=%d] opacity %s" % (con_id, opacity) for con_id, opacity in opacities.items())
+        )
+
+    def resync(self, args):
+        self.con_to_ws.clear()
+        self.focused_set.clear()
+        self.stale = False
+        tree = self.get_tree()
+        for workspace in tree.workspaces():
+            self.add_workspace(workspace)
+        focused = tree.find_focused()
+        if focused is not None:
+            workspace = focused.workspace()
+            self.focused_ws = workspace.id if workspace else None
+        opacities = {}
+        for window in views(tree):
+            if window.focused:
+                self.focused_set.add(window.id)
+                opacities[window.id] = args.focused
+            else:
+                opacities[window.id] = args.opacity
+        self.set_opacity(opacities)
+
+    def add_workspace(self, workspace):
+        for con in workspace:
+            self.con_to_ws[con.id] = workspace.id
+
+    def remap(self):
+        """Relearn the workspace of every container, leaving opacities as they are."""
+        self.con_to_ws.clear()
+        for workspace in self.get_tree().workspaces():
+            self.add_workspace(workspace)
+        # opaque windows that are gone cannot be made transparent anymore
+        self.focused_set &= self.con_to_ws.keys()
+
+
+class FadeAnimator:
+    """Fades containers to their target opacity instead of switching at once.
+
+    Frames run from a timer thread (the command socket is separate from the
+    event socket) at no more than `fps` per second, and each frame sends one
+    batched command for all containers that are still fading.
+    """
+
+    def __init__(self, shadow, args):
+        self.shadow = shadow
+        self.args = args
+        self.duration = args.fade_duration
+        self.interval = 1.0 / args.fade_fps
+        self.fades = {}  # container id -> (start opacity, target opacity, start time)
+        self.lock = Lock()
+        self.timer = None
+
+    def fade(self, opacities):
+        now = time.monotonic()
+        with self.lock:
+            for con_id, target in opacities.items():
+                target = float(target)
+                if con_id in self.fades:
+                    # retarget an in-flight fade from where it is now
+                    start = self.value(self.fades[con_id], now)
+                elif target == float(self.args.focused):
+                    start = float(self.args.opacity)
+                else:
+                    start = float(self.args.focused)
+                self.fades[con_id] = (start, target, now)
+            if self.timer is None:
+                self.schedule()
+
+    def cancel(self, con_id):
+        with self.lock:
+            self.fades.pop(con_id, None)
+
+    def stop(self):
+        with self.lock:
+            self.fades.clear()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def value(self, fade, now):
+        start, target, started = fade
+        progress = min(1.0, (now - started) / self.duration)
+        return start + (target - start) * progress
+
+    def schedule(self):
+        self.timer = Timer(self.interval, self.frame)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def frame(self):
+        now = time.monotonic()
+        with self.lock:
+            opacities = {}
+            for con_id, fade in list(self.fades.items()):
+                opacities[con_id] = "%.3f" % self.value(fade, now)
+                if now - fade[2] >= self.duration:
+                    del self.fades[con_id]
+            self.shadow.set_opacity(opacities)
+            self.timer = None
+            if self.fades:
+                self.schedule()
+
+
+def on_window(args, shadow, animator, ipc, event):
+    if event.change == "close":
+        shadow.con_to_ws.pop(event.container.id, None)
+        shadow.focused_set.discard(event.container.id)
+        if animator is not None:
+            animator.cancel(event.container.id)
+        return
+    if event.change == "move":
+        # the destination is not part of the event, it is learned on next focus;
+        # a moved split container takes the windows of its subtree along
+        for con in [event.container, *event.container.descendants()]:
+            shadow.con_to_ws.pop(con.id, None)
+        return
+    if event.change != "focus":
+        return
+
+    if shadow.stale or shadow.focused_ws is None:
+        shadow.resync(args)
         return
 
-    focused_workspace = focused.workspace()
+    focused = event.container
+    # a focused window is always on the focused workspace
+    shadow.con_to_ws[focused.id] = shadow.focused_ws
+
+    if not args.global_focus and any(shadow.con_to_ws.get(window_id) is None for window_id in shadow.focused_set):
+        # an opaque window moved somewhere we have not seen yet, only where it
+        # went is needed, the opacities of all windows are still right
+        shadow.remap()
 
-    focused.command("opacity " + args.focused)
-    focused_set.add(focused.id)
+    opacities = {focused.id: args.focused}
+    shadow.focused_set.add(focused.id)
 
     to_remove = set()
-    for window_id in focused_set:
+    for window_id in shadow.focused_set:
         if window_id == focused.id:
             continue
-        window = tree.find_by_id(window_id)
-        if window is None:
-            to_remove.add(window_id)
-        elif args.global_focus or window.workspace() == focused_workspace:
-            window.command("opacity " + args.opacity)
+        if args.global_focus or shadow.con_to_ws.get(window_id) == shadow.focused_ws:
+            opacities[window_id] = args.opacity
             to_remove.add(window_id)
 
-    focused_set -= to_remove
+    shadow.focused_set -= to_remove
+    if animator is not None:
+        animator.fade(opacities)
+    else:
+        shadow.set_opacity(opacities)
 
-def remove_opacity(ipc, focused_opacity):
-    for workspace in ipc.get_tree().workspaces():
-        for w in workspace:
-            w.command("opacity " + focused_opacity)
-    ipc.main_quit()
-    sys.exit(0)
 
+def on_workspace(args, shadow, ipc, event):
+    if event.change == "reload":
+        shadow.resync(args)
+    elif event.change == "focus" and event.current is not None:
+        shadow.focused_ws = event.current.id
+        # the event carries the workspace subtree, use it to refresh the mapping
+        shadow.add_workspace(event.current)
 
-if __name__ == "__main__":
+
+def on_shutdown(shadow, ipc, event):
+    shadow.stale = True
+
+
+def queue_event(coalescer, kind, ipc, event):
+    coalescer.push((kind, event))
+
+
+def flush_events(args, shadow, animator, ipc, events):
+    """Handle a batch of (kind, event) in order.
+
+    Of the window focus events only the last one is handled, the windows
+    focused on the way there keep their opacity.
+    """
+    focus = [i for i, (kind, event) in enumerate(events) if kind == "window" and event.change == "focus"]
+    skip = set(focus[:-1])
+    for i, (kind, event) in enumerate(events):
+        if i in skip:
+            continue
+        if kind == "window":
+            on_window(args, shadow, animator, ipc, event)
+        elif kind == "workspace":
+            on_workspace(args, shadow, ipc, event)
+        else:
+            on_shutdown(shadow, ipc, event)
+
+
+def remove_opacity(ipc, shadow, animator, coalescer, args):
+    if coalescer is not None:
+        coalescer.stop()
+    if animator is not None:
+        animator.stop()
+    shadow.set_opacity({w.id: args.focused for w in views(shadow.get_tree())})
+    if args.stats:
+        print("sent %d IPC messages" % shadow.ipc_messages, file=sys.stderr)
+        if coalescer is not None:
+            print("coalesced %d of %d events" % (coalescer.folded, coalescer.received), file=sys.stderr)
+
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="This script allows you to set the transparency of unfocused windows in sway."
     )
@@ -74,18 +276,89 @@ if __name__ == "__main__":
         action="store_true",
         help="only have one opaque window across all workspaces",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the number of IPC messages sent on exit",
+    )
+    parser.add_argument(
+        "--fade-duration",
+        type=float,
+        default=0.0,
+        help="fade opacity changes over this many seconds, 0 disables fading",
+    )
+    parser.add_argument(
+        "--fade-fps",
+        type=float,
+        default=30.0,
+        help="maximum number of fade frames (IPC messages) per second",
+    )
+    parser.add_argument(
+        "--coalesce",
+        type=float,
+        default=0.0,
+        help="handle events together once none arrived for this many seconds, 0 disables it",
+    )
+    parser.add_argument(
+        "--coalesce-max-delay",
+        type=float,
+        default=0.2,
+        help="handle coalesced events at the latest this many seconds after the first one",
+    )
+    parser.add_argument(
+        "--lean-tree",
+        action="store_true",
+        help="read the layout tree with swaytree.py, keeping only the fields used here",
+    )
+    return parser.parse_args(argv)
+
+
+def setup(ipc, args):
+    """Subscribe to the events of ipc and make the inactive windows transparent.
 
+    Returns the function that makes all windows opaque again on exit.
+    """
+    shadow = ShadowTree(ipc, args.lean_tree)
+    shadow.resync(args)
+    animator = FadeAnimator(shadow, args) if args.fade_duration > 0 else None
+
+    if args.coalesce > 0:
+        # a focus storm ends up as one opacity change for the last focused window
+        from coalescer import Coalescer
+
+        coalescer = Coalescer(
+            partial(flush_events, args, shadow, animator, ipc), args.coalesce, args.coalesce_max_delay
+        )
+        window_handler = partial(queue_event, coalescer, "window")
+        workspace_handler = partial(queue_event, coalescer, "workspace")
+        shutdown_handler = partial(queue_event, coalescer, "shutdown")
+    else:
+        coalescer = None
+        window_handler = partial(on_window, args, shadow, animator)
+        workspace_handler = partial(on_workspace, args, shadow)
+        shutdown_handler = partial(on_shutdown, shadow)
+
+    # only subscribe to the changes that can affect focus or the mapping, so
+    # title and mark changes never reach the script
+    for change in ["focus", "close", "move"]:
+        ipc.on("window::" + change, window_handler)
+    for change in ["focus", "reload"]:
+        ipc.on("workspace::" + change, workspace_handler)
+    ipc.on(i3ipc.Event.SHUTDOWN, shutdown_handler)
+    return partial(remove_opacity, ipc, shadow, animator, coalescer, args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
     ipc = i3ipc.Connection()
-    focused_set = set()
+    cleanup = setup(ipc, args)
+
+    def on_exit(signum, frame):
+        # the main thread may hold a lock the cleanup needs when the signal
+        # arrives, so only stop the loop here and clean up once it returned
+        ipc.main_quit()
 
-    for window in ipc.get_tree():
-        if window.focused:
-            focused_set.add(window.id)
-            window.command("opacity " + args.focused)
-        else:
-            window.command("opacity " + args.opacity)
     for sig in [signal.SIGINT, signal.SIGTERM]:
-        signal.signal(sig, lambda signal, frame: remove_opacity(ipc, args.focused))
-    ipc.on("window", partial(on_window, args))
+        signal.signal(sig, on_exit)
     ipc.main()
+    cleanup()
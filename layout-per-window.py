@@ -2,46 +2,168 @@
 
 # This script keeps track of the active layout for each window.
 # Optional argument defines numeric layout index for new windows (counted from 0)
+# With --per-app, layouts are remembered per app_id/class instead of per window
+# and saved to disk, so new windows of a known app and restarts keep their layout.
 #
 # This script requires i3ipc-python package (install it from a system package
 # manager or pip).
 
+import argparse
+import json
+import os
+import signal
 import sys
-from typing import Optional
+from collections import OrderedDict
+from threading import Lock, Timer
+from typing import Any, Callable, Optional
 
 import i3ipc
 
 
-def on_window_focus(ipc: i3ipc.connection.Connection, event: i3ipc.events.WindowEvent):
-    global windows, prev_focused, default_layout
+class LayoutMemory:
+    """Saved layouts per window key, bounded to the most recently used entries.
+
+    If a path is given the entries are loaded from it and written back at most
+    once per flush interval, rather than on every focus change.
+    """
+
+    def __init__(self, max_entries: int, path: Optional[str] = None, flush_interval: float = 30.0):
+        self.max_entries = max_entries
+        self.path = path
+        self.flush_interval = flush_interval
+        self.entries: OrderedDict[Any, dict] = OrderedDict()
+        self.lock = Lock()
+        self.timer: Optional[Timer] = None
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.entries
+
+    def __getitem__(self, key: Any) -> dict:
+        with self.lock:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def __setitem__(self, key: Any, layouts: dict) -> None:
+        with self.lock:
+            if self.entries.get(key) == layouts:
+                self.entries.move_to_end(key)
+                return
+            self.entries[key] = layouts
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.schedule_flush()
+
+    def __delitem__(self, key: Any) -> None:
+        with self.lock:
+            del self.entries[key]
+        self.schedule_flush()
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Could not read {self.path}: {e}", file=sys.stderr)
+            return
+        # stored oldest first, so the LRU order survives restarts
+        for key, layouts in entries:
+            if isinstance(key, str):
+                self.entries[key] = layouts
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def schedule_flush(self) -> None:
+        if self.path is None or self.timer is not None:
+            return
+        self.timer = Timer(self.flush_interval, self.flush)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def flush(self) -> None:
+        if self.path is None:
+            return
+        with self.lock:
+            self.timer = None
+            # container ids are reused by the next sway session, only app keys are kept
+            data = [(key, layouts) for key, layouts in self.entries.items() if isinstance(key, str)]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not write {self.path}: {e}", file=sys.stderr)
+
+
+# State shared by the event handlers, initialized by setup()
+windows: LayoutMemory
+layouts: dict[str, Optional[int]] = {}
+prev_focused: Any = None
+default_layout: Optional[int] = None
+per_app = False
+
+
+def window_key(container: i3ipc.Con) -> Any:
+    # windows without app_id or class are remembered by id, for this session only
+    if per_app:
+        return container.app_id or container.window_class or container.id
+    return container.id
 
-    # Get current layouts
-    layouts = {
-        input.identifier: input.xkb_active_layout_index for input in ipc.get_inputs()
-    }
+
+def on_window_focus(ipc: i3ipc.connection.Connection, event: i3ipc.events.WindowEvent):
+    global windows, prev_focused, default_layout, layouts
 
     # Save layouts for previous window
-    windows[prev_focused] = layouts
+    if prev_focused is not None:
+        windows[prev_focused] = dict(layouts)
 
     # Restore layout of the newly focused known window
-    if event.container.id in windows:
-        for kdb_id, layout_index in windows[event.container.id].items():
-            if layout_index != layouts[kdb_id]:
-                ipc.command(f'input "{kdb_id}" xkb_switch_layout {layout_index}')
-                break
+    key = window_key(event.container)
+    if key in windows:
+        switch = {
+            kdb_id: layout_index
+            for kdb_id, layout_index in windows[key].items()
+            if kdb_id in layouts and layout_index != layouts[kdb_id]
+        }
 
     # Set default layout for a fresh window
     elif default_layout is not None:
-        for kdb_id, layout_index in layouts.items():
-            if layout_index is not None and layout_index != default_layout:
-                ipc.command(f'input "{kdb_id}" xkb_switch_layout {default_layout}')
-                break
+        switch = {
+            kdb_id: default_layout
+            for kdb_id, layout_index in layouts.items()
+            if layout_index is not None and layout_index != default_layout
+        }
+    else:
+        switch = {}
+
+    # Switch every affected keyboard with a single command
+    if switch:
+        ipc.command("; ".join(
+            f'input "{kdb_id}" xkb_switch_layout {layout_index}' for kdb_id, layout_index in switch.items()
+        ))
+        layouts.update(switch)
+
+    prev_focused = key
 
-    prev_focused = event.container.id
+
+def on_input(ipc: i3ipc.connection.Connection, event: i3ipc.events.InputEvent):
+    global layouts
+    if event.change == "removed":
+        layouts.pop(event.input.identifier, None)
+    else:
+        layouts[event.input.identifier] = event.input.xkb_active_layout_index
 
 
 def on_window_close(ipc: i3ipc.connection.Connection, event: i3ipc.events.WindowEvent):
     global windows
+    # per-app entries outlive their windows, that is the point of them, only
+    # the entries kept by container id go away with the window
     if event.container.id in windows:
         del windows[event.container.id]
 
@@ -53,25 +175,81 @@ def on_window(ipc: i3ipc.connection.Connection, event: i3ipc.events.WindowEvent)
         on_window_close(ipc, event)
 
 
-if __name__ == "__main__":
-    default_layout: Optional[int] = None
-    if len(sys.argv) == 2:
-        if sys.argv[1].isnumeric():
-            default_layout = int(sys.argv[1])
-        else:
-            print(f"Expected an integer, got: {sys.argv[1]}", file=sys.stderr)
-            sys.exit(2)
-    elif len(sys.argv) > 2:
-        print("Too many arguments", file=sys.stderr)
-        sys.exit(2)
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Keep track of the active keyboard layout for each window."
+    )
+    parser.add_argument(
+        "default_layout",
+        type=int,
+        nargs="?",
+        help="numeric layout index for new windows (counted from 0)",
+    )
+    parser.add_argument(
+        "--per-app",
+        action="store_true",
+        help="remember layouts per app_id/class and keep them across restarts",
+    )
+    parser.add_argument(
+        "--max-entries",
+        type=int,
+        default=512,
+        help="maximum number of remembered windows or apps",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=os.path.join(
+            os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state")), "sway-layout-per-window.json"
+        ),
+        help="file to keep per-app layouts in (with --per-app)",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=30.0,
+        help="seconds to batch changes before writing the store",
+    )
+    return parser.parse_args(argv)
+
+
+def setup(ipc: i3ipc.Connection, args: argparse.Namespace) -> Callable[[], None]:
+    """Subscribe to the events of ipc, return the function to call on exit."""
+    global windows, prev_focused, default_layout, per_app, layouts
+    default_layout = args.default_layout
+    per_app = args.per_app
+
+    windows = LayoutMemory(args.max_entries, args.store if per_app else None, args.flush_interval)
+    windows.load()
 
-    ipc = i3ipc.Connection()
     focused = ipc.get_tree().find_focused()
     if focused:
-        prev_focused = focused.id
+        prev_focused = window_key(focused)
     else:
         prev_focused = None
-    windows: dict = {}
+
+    # Current layout of each input device, kept up to date from input events
+    # instead of enumerating all devices on every focus change
+    layouts = {
+        input.identifier: input.xkb_active_layout_index for input in ipc.get_inputs()
+    }
 
     ipc.on("window", on_window)
+    ipc.on("input", on_input)
+    return windows.flush
+
+
+if __name__ == "__main__":
+    ipc = i3ipc.Connection()
+    cleanup = setup(ipc, parse_args())
+
+    def on_exit(signum: int, frame: Any) -> None:
+        # writing the store takes its lock, which the main thread may hold when
+        # the signal arrives, so only stop the loop here
+        ipc.main_quit()
+
+    for sig in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(sig, on_exit)
+
     ipc.main()
+    cleanup()
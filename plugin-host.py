@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+
+# This script runs several of the scripts in this repository in one process,
+# on one IPC connection, instead of one interpreter and one connection each.
+#
+# Every event is received and decoded once and handed to all scripts that
+# subscribed to it. While the scripts handle an event they share one
+# get_tree() reply, also with the scripts using swaytree.py. The commands of
+# each script go out on their own, so every script gets the replies to its
+# commands and an invalid command of one script never stops those of another.
+#
+# Scripts are given with their own arguments, for example:
+#
+# exec /path/to/plugin-host.py \
+#     -p "autoname-workspaces.py --duplicates" \
+#     -p "inactive-windows-transparency.py -o 0.8" \
+#     -p "layout-per-window.py 0" \
+#     -p switch-top-level.py \
+#     -p firefox-focus-monitor.py
+#
+# With --asyncio the events are read on an i3ipc.aio connection and queued
+# for each script, so a slow script holds up neither reading the next events
+# nor the other scripts. Each script handles its events in order, in a worker
+# thread of its own. Commands are written to sway without waiting for the
+# replies of earlier ones, a script only waits for the replies it looks at.
+# This works for a single script as well, e.g.
+# plugin-host.py --asyncio -p layout-per-window.py
+#
+# Relative paths are looked up next to this script. A script can be hosted
+# if it has a setup(ipc, args) function, which subscribes to the events and
+# returns the function to call on exit, and optionally parse_args(argv).
+#
+# This script requires i3ipc-python package (install it from a system package
+# manager or pip).
+
+import argparse
+import asyncio
+import importlib.machinery
+import importlib.util
+import json
+import logging
+import os
+import shlex
+import signal
+import struct
+import sys
+from collections import defaultdict, deque
+from collections.abc import Sequence
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from threading import Lock, local
+from types import ModuleType
+from typing import Any, Callable, Iterator, Optional, Union
+
+import i3ipc
+import i3ipc.aio
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IPC_MAGIC = b"i3-ipc"
+IPC_HEADER = "=%dsII" % len(IPC_MAGIC)
+IPC_HEADER_SIZE = struct.calcsize(IPC_HEADER)
+# message types of the i3/sway IPC protocol
+RUN_COMMAND = 0
+GET_TREE = 4
+
+
+class SharedConnection:
+    """What a hosted script sees as its i3ipc.Connection.
+
+    Subscriptions, get_tree() and command() go through the host, everything
+    else is passed to the real connection.
+    """
+
+    def __init__(self, host: "PluginHost") -> None:
+        self._host = host
+
+    def on(self, event: Union[i3ipc.Event, str], handler: Callable[[Any, Any], None]) -> None:
+        self._host.subscribe(event, handler)
+
+    def get_tree(self) -> i3ipc.Con:
+        return self._host.get_tree()
+
+    def get_tree_data(self) -> Union[bytes, str]:
+        return self._host.get_tree_data()
+
+    def command(self, payload: str) -> Sequence[i3ipc.CommandReply]:
+        return self._host.command(payload)
+
+    def main_quit(self) -> None:
+        self._host.ipc.main_quit()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._host.ipc, name)
+
+
+class Snapshot:
+    """The tree shared by everything handled in one batch.
+
+    It is fetched when first asked for, by whichever thread asks first.
+    """
+
+    def __init__(self, host: "PluginHost") -> None:
+        self.host = host
+        self.lock = Lock()
+        self.tree: Optional[i3ipc.Con] = None
+        self.tree_data: Optional[Union[bytes, str]] = None
+
+    def get_tree(self) -> i3ipc.Con:
+        data = self.get_tree_data()
+        with self.lock:
+            if self.tree is None:
+                self.tree = i3ipc.Con(json.loads(data), None, self.host.shared)
+            return self.tree
+
+    def get_tree_data(self) -> Union[bytes, str]:
+        with self.lock:
+            if self.tree_data is None:
+                self.tree_data = self.host.fetch_tree_data()
+            return self.tree_data
+
+
+class PluginHost:
+    def __init__(self, ipc: i3ipc.Connection) -> None:
+        self.ipc = ipc
+        self.shared = SharedConnection(self)
+        # base event -> [(script, change or None for all changes, handler)]
+        self.handlers: dict[str, list[tuple[str, Optional[str], Callable[[Any, Any], None]]]] = defaultdict(list)
+        self.cleanups: list[Callable[[], None]] = []
+        self.loading = ""  # script being set up, owner of its subscriptions
+        # .snapshot of the batch the thread is handling, None outside of one
+        self.local = local()
+        self.events = 0
+        self.messages = 0  # requests sent to sway, see --stats
+
+    def load(self, spec: str) -> None:
+        "load a script given as 'path [arguments...]' and set it up"
+        (path, *argv) = shlex.split(spec)
+        if not os.path.exists(path):
+            path = os.path.join(SCRIPT_DIR, path)
+        name = os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+        loader = importlib.machinery.SourceFileLoader(name, path)
+        module_spec = importlib.util.spec_from_loader(name, loader)
+        assert module_spec is not None
+        module: ModuleType = importlib.util.module_from_spec(module_spec)
+        loader.exec_module(module)
+        if not hasattr(module, "setup"):
+            raise SystemExit(f"{path} can not be hosted, it has no setup() function")
+
+        args = module.parse_args(argv) if hasattr(module, "parse_args") else None
+        self.loading = path
+        with self.batch():
+            cleanup = module.setup(self.shared, args)
+        if cleanup is not None:
+            self.cleanups.append(cleanup)
+        logger.info("loaded %s", path)
+
+    def load_all(self, specs: list[str]) -> None:
+        # the scripts read the tree and set things up together too
+        with self.batch():
+            for spec in specs:
+                self.load(spec)
+
+    def subscribe(self, event: Union[i3ipc.Event, str], handler: Callable[[Any, Any], None]) -> None:
+        name = event.value if isinstance(event, i3ipc.Event) else event
+        (base, _, change) = name.partition("::")
+        if base not in self.handlers:
+            # one subscription per event type, however many scripts want it
+            self.listen(base)
+        self.handlers[base].append((self.loading, change or None, handler))
+
+    def listen(self, base: str) -> None:
+        self.ipc.on(base, partial(self.dispatch, base))
+
+    @contextmanager
+    def batch(self, snapshot: Optional[Snapshot] = None) -> Iterator[None]:
+        "share one tree for everything done inside, or the tree of snapshot"
+        if self.snapshot() is not None:
+            yield
+            return
+        self.local.snapshot = snapshot or Snapshot(self)
+        try:
+            yield
+        finally:
+            self.local.snapshot = None
+
+    def snapshot(self) -> Optional[Snapshot]:
+        # scripts may also read the tree from their own threads (timers),
+        # those are not part of a batch and get a tree of their own
+        return getattr(self.local, "snapshot", None)
+
+    def dispatch(self, base: str, _ipc: i3ipc.Connection, event: Any) -> None:
+        self.events += 1
+        with self.batch():
+            self.handle(base, event)
+
+    def handle(self, base: str, event: Any, script: Optional[str] = None) -> None:
+        "run the handlers for event, only those of script if given"
+        change = getattr(event, "change", None)
+        for owner, handler_change, handler in list(self.handlers[base]):
+            if script is not None and owner != script:
+                continue
+            if handler_change is not None and handler_change != change:
+                continue
+            try:
+                handler(self.shared, event)
+            except Exception:
+                # one broken script should not take the others down
+                logger.exception("error handling %s event in %s", base, owner)
+
+    def get_tree(self) -> i3ipc.Con:
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return i3ipc.Con(json.loads(self.fetch_tree_data()), None, self.shared)
+        return snapshot.get_tree()
+
+    def get_tree_data(self) -> Union[bytes, str]:
+        "the raw GET_TREE reply, for swaytree.get_tree()"
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return self.fetch_tree_data()
+        return snapshot.get_tree_data()
+
+    def fetch_tree_data(self) -> Union[bytes, str]:
+        self.messages += 1
+        import swaytree
+
+        return swaytree.read_tree_data(self.ipc)
+
+    def command(self, payload: str) -> Sequence[i3ipc.CommandReply]:
+        # sway stops a command list at the first failure, so the commands of
+        # different scripts are never joined
+        return self.send(payload)
+
+    def send(self, payload: str) -> Sequence[i3ipc.CommandReply]:
+        self.messages += 1
+        replies = self.ipc.command(payload)
+        log_failures(replies)
+        return replies
+
+    def cleanup(self) -> None:
+        with self.batch():
+            for cleanup in self.cleanups:
+                try:
+                    cleanup()
+                except Exception:
+                    logger.exception("error cleaning up")
+
+
+def log_failures(replies: Sequence[i3ipc.CommandReply]) -> None:
+    for reply in replies:
+        if not reply.success:
+            logger.error("command failed: %s", reply.error)
+
+
+class CommandPipe:
+    """Requests to sway on a socket of their own, written without waiting for
+    the replies to the earlier ones.
+
+    Sway answers requests in order, so replies are handed out first in, first
+    out. Must be used from the event loop thread. Once the socket is closed,
+    the requests still waiting and all later ones fail with ConnectionError.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.waiting: deque[asyncio.Future] = deque()
+        self.closed = False
+        self.reader_task = asyncio.ensure_future(self.read_replies())
+
+    @classmethod
+    async def open(cls, path: str) -> "CommandPipe":
+        (reader, writer) = await asyncio.open_unix_connection(path)
+        return cls(reader, writer)
+
+    async def request(self, message_type: int, payload: str = "") -> bytes:
+        if self.closed:
+            raise ConnectionError("sway closed the IPC socket")
+        data = payload.encode()
+        self.writer.write(IPC_MAGIC + struct.pack("=II", len(data), message_type) + data)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        return await future
+
+    async def read_replies(self) -> None:
+        try:
+            while True:
+                (_, length, _) = struct.unpack(IPC_HEADER, await self.reader.readexactly(IPC_HEADER_SIZE))
+                reply = await self.reader.readexactly(length)
+                future = self.waiting.popleft()
+                if not future.cancelled():
+                    future.set_result(reply)
+        except (asyncio.IncompleteReadError, OSError) as e:
+            logger.error("IPC socket closed: %s", e)
+        finally:
+            # nothing answers the requests anymore, also when cancelled
+            self.closed = True
+            while self.waiting:
+                future = self.waiting.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError("sway closed the IPC socket"))
+
+    async def drain(self) -> None:
+        "wait for the replies to everything sent so far"
+        if self.waiting:
+            await asyncio.wait(list(self.waiting))
+
+
+class PendingReplies(Sequence):
+    """The replies to a pipelined command, waited for when first looked at.
+
+    Must not be looked at from the event loop thread.
+    """
+
+    def __init__(self, future: "Future[bytes]") -> None:
+        self.future = future
+        self.replies: Optional[list[i3ipc.CommandReply]] = None
+
+    def get(self) -> list[i3ipc.CommandReply]:
+        if self.replies is None:
+            self.replies = [i3ipc.CommandReply(reply) for reply in json.loads(self.future.result())]
+        return self.replies
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.get()[index]
+
+    def __len__(self) -> int:
+        return len(self.get())
+
+
+class AsyncPluginHost(PluginHost):
+    """Plugin host reading events on an i3ipc.aio connection.
+
+    The event loop only queues the events, for each script on a queue of its
+    own. Every script handles its events in order in a worker thread, next to
+    the other scripts, and the scripts handling the same event share its
+    tree. Commands are pipelined through a CommandPipe and their replies
+    checked when they arrive, a get_tree() waits only for its own reply.
+    """
+
+    def __init__(self, ipc: i3ipc.Connection, aio: i3ipc.aio.Connection, pipe: CommandPipe) -> None:
+        super().__init__(ipc)
+        self.aio = aio
+        self.pipe = pipe
+        self.loop = asyncio.get_running_loop()
+        # script -> (base event, event, snapshot), None to stop the worker
+        self.queues: dict[str, asyncio.Queue[Optional[tuple[str, Any, Snapshot]]]] = {}
+
+    def listen(self, base: str) -> None:
+        # scripts subscribe from the worker thread, run() subscribes on the loop
+        pass
+
+    def fetch_tree_data(self) -> Union[bytes, str]:
+        self.messages += 1
+        return asyncio.run_coroutine_threadsafe(self.pipe.request(GET_TREE), self.loop).result()
+
+    def send(self, payload: str) -> Sequence[i3ipc.CommandReply]:
+        self.messages += 1
+        future = asyncio.run_coroutine_threadsafe(self.pipe.request(RUN_COMMAND, payload), self.loop)
+        future.add_done_callback(self.check_replies)
+        # failures are logged when the replies arrive, only a script looking
+        # at the replies waits for them
+        return PendingReplies(future)
+
+    def check_replies(self, future: "Future[bytes]") -> None:
+        if future.exception() is None:
+            log_failures([i3ipc.CommandReply(reply) for reply in json.loads(future.result())])
+
+    def enqueue(self, base: str, _aio: i3ipc.aio.Connection, event: Any) -> None:
+        self.events += 1
+        snapshot = Snapshot(self)
+        for script in {owner for (owner, _, _) in self.handlers[base]}:
+            self.queues[script].put_nowait((base, event, snapshot))
+
+    async def work(self, script: str) -> None:
+        queue = self.queues[script]
+        while (item := await queue.get()) is not None:
+            await asyncio.to_thread(self.handle_batch, script, *item)
+
+    def handle_batch(self, script: str, base: str, event: Any, snapshot: Snapshot) -> None:
+        with self.batch(snapshot):
+            self.handle(base, event, script)
+
+    async def stop(self, workers: Sequence[asyncio.Future]) -> None:
+        "stop the workers once the events they are handling are done"
+        for queue in self.queues.values():
+            # the events still queued are dropped
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        # cancelling would not stop a handler running in its thread
+        await asyncio.gather(*workers)
+
+    async def run(self) -> None:
+        for base, handlers in self.handlers.items():
+            self.aio.on(base, partial(self.enqueue, base))
+            for owner, _, _ in handlers:
+                self.queues.setdefault(owner, asyncio.Queue())
+        for sig in [signal.SIGINT, signal.SIGTERM]:
+            self.loop.add_signal_handler(sig, self.aio.main_quit)
+        workers = [asyncio.ensure_future(self.work(script)) for script in self.queues]
+        try:
+            await self.aio.main()
+        finally:
+            await self.stop(workers)
+            await asyncio.to_thread(self.cleanup)
+            await self.pipe.drain()
+
+
+async def run_async(args: argparse.Namespace) -> AsyncPluginHost:
+    aio = await i3ipc.aio.Connection().connect()
+    pipe = await CommandPipe.open(aio.socket_path)
+    host = AsyncPluginHost(i3ipc.Connection(), aio, pipe)
+    await asyncio.to_thread(host.load_all, args.plugin)
+    await host.run()
+    return host
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run several scripts in one process, sharing one IPC connection."
+    )
+    parser.add_argument(
+        "--plugin",
+        "-p",
+        action="append",
+        required=True,
+        help="script to run with its arguments, can be given several times",
+    )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="read events on an asyncio loop and pipeline the commands",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the number of events and IPC messages on exit",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Increase verbosity")
+    return parser.parse_args()
+
+
+def print_stats(args: argparse.Namespace, host: PluginHost) -> None:
+    if args.stats:
+        print("handled %d events with %d IPC messages" % (host.events, host.messages), file=sys.stderr)
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+    if args.asyncio:
+        print_stats(args, asyncio.run(run_async(args)))
+        return
+
+    ipc = i3ipc.Connection()
+    host = PluginHost(ipc)
+    host.load_all(args.plugin)
+
+    def on_exit(signum: int, frame: Any) -> None:
+        # only stop the loop here, the signal may have interrupted a request
+        # that holds the command socket
+        ipc.main_quit()
+
+    for sig in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(sig, on_exit)
+
+    try:
+        ipc.main()
+    finally:
+        host.cleanup()
+        print_stats(args, host)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,61 +7,137 @@
 #
 # bindsym $mod+a focus parent # from default sway config
 # bindsym $mod+Shift+s exec sort-container.py
+# bindsym $mod+Shift+d exec sort-container.py --key app_id --reverse
+#
+# Or run it as a daemon to avoid starting python on every keypress:
+#
+# exec sort-container.py --daemon
+# bindsym $mod+Shift+s nop sort-container
+# bindsym $mod+Shift+d nop sort-container --key app_id --reverse
 
+import argparse
 import re
+import shlex
+from functools import partial
 
 import i3ipc
 
+# container fields used with --lean-tree
+TREE_FIELDS = ("focused", "layout", "pid", "app_id", "window_class")
 
-def str_compare(str1, str2):
-    split1 = re.split("([0-9]+)", str1)
-    split2 = re.split("([0-9]+)", str2)
 
-    for i, item in enumerate(split1):
-        try:
-            split1[i] = int(item)
-        except ValueError:
-            pass
+def natural_key(string):
+    # re.split with a group alternates text and digits, so ints and strs
+    # always end up at the same positions and compare fine
+    split = re.split("([0-9]+)", string)
+    for i in range(1, len(split), 2):
+        split[i] = int(split[i])
+    return split
 
-    for i, item in enumerate(split2):
-        try:
-            split2[i] = int(item)
-        except ValueError:
-            pass
 
-    return split1 < split2
+def sort_key(args, leaf):
+    if args.key == "pid":
+        return leaf.pid or 0
+    if args.key == "app_id":
+        value = leaf.app_id or leaf.window_class or ""
+    else:
+        value = leaf.name or ""
+    return value if args.lexical else natural_key(value)
 
 
-if __name__ == "__main__":
-    ipc = i3ipc.Connection()
+def swap_commands(leaves, keys, reverse=False):
+    """Return swap commands that put leaves in the order of keys.
 
-    focused = ipc.get_tree().find_focused()
+    Every swap places at least one leaf at its final position, so this needs
+    at most len(leaves) - 1 commands (one less per cycle of the permutation),
+    and leaves that are already in place are never touched.
+    """
+    order = sorted(range(len(leaves)), key=keys.__getitem__, reverse=reverse)
+    current = list(range(len(leaves)))  # position -> leaf index
+    position = list(range(len(leaves)))  # leaf index -> position
+    commands = []
+    for i, want in enumerate(order):
+        have = current[i]
+        if have == want:
+            continue
+        j = position[want]
+        commands.append(f'[con_id="{leaves[have].id}"] swap container with con_id {leaves[want].id}')
+        current[i], current[j] = want, have
+        position[want], position[have] = i, j
+    return commands, [leaves[i] for i in order]
 
-    layout = focused.layout
 
-    if layout == "splitv" or layout == "stacked":
-        move_prev = "move up"
-    elif layout == "splith" or layout == "tabbed":
-        move_prev = "move left"
-    else:
-        exit()
+def sort_container(ipc, focused, args):
+    if focused.layout not in ("splitv", "stacked", "splith", "tabbed"):
+        return
 
     leaves = focused.leaves()
-    commands = []
-
-    # insertion sort
-    for i in range(1, len(leaves)):
-        # focus leaf i
-        commands.append(f'[con_id="{leaves[i].id}"] focus')
-
-        # insert leaf i into sorted section
-        for j in reversed(range(0, i)):
-            if str_compare(leaves[j].name, leaves[j+1].name):
-                break
-            leaves[j+1], leaves[j] = leaves[j], leaves[j+1]
-            commands.append(move_prev)
+    if not leaves:
+        return
+    keys = [sort_key(args, leaf) for leaf in leaves]
+    commands, ordered = swap_commands(leaves, keys, args.reverse)
+    commands.append(f'[con_id="{ordered[0].id}"] focus')
+
+    # all swaps in one message, so sway applies them without intermediate redraws
+    ipc.command("; ".join(commands))
+
+
+def find_focused(ipc, lean_tree):
+    if lean_tree:
+        import swaytree
+
+        return swaytree.get_tree(ipc, TREE_FIELDS).find_focused()
+    return ipc.get_tree().find_focused()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sort the children of the focused container.")
+    parser.add_argument(
+        "--key",
+        "-k",
+        choices=["title", "app_id", "pid"],
+        default="title",
+        help="what to sort by (default: title)",
+    )
+    parser.add_argument(
+        "--lexical",
+        "-l",
+        action="store_true",
+        help="compare as plain strings instead of natural order (2 < 10)",
+    )
+    parser.add_argument("--reverse", "-r", action="store_true", help="sort in descending order")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="stay running and sort on 'nop sort-container [options]' bindings",
+    )
+    parser.add_argument(
+        "--lean-tree",
+        action="store_true",
+        help="read the layout tree with swaytree.py, keeping only the fields used here",
+    )
+    return parser.parse_args(argv)
+
+
+def on_binding(lean_tree, ipc, event):
+    # whole words, so "nop sort-containers" is left to whatever binds it; other
+    # bindings are not split with shlex, their quoting is none of our business
+    if event.binding.command.split()[:2] != ["nop", "sort-container"]:
+        return
+    words = shlex.split(event.binding.command)
+    try:
+        args = parse_args(words[2:])
+    except SystemExit:
+        # argparse already printed what was wrong with the binding
+        return
+    sort_container(ipc, find_focused(ipc, lean_tree or args.lean_tree), args)
 
-    commands.append(f'[con_id="{leaves[0].id}"] focus')
 
-    for cmd in commands:
-        ipc.command(cmd)
+if __name__ == "__main__":
+    args = parse_args()
+    ipc = i3ipc.Connection()
+    if args.daemon:
+        ipc.on(i3ipc.Event.BINDING, partial(on_binding, args.lean_tree))
+        ipc.main()
+    else:
+        sort_container(ipc, find_focused(ipc, args.lean_tree), args)
@@ -6,9 +6,10 @@
 # each workspace number 1-10 has it's own stack
 # Useful to declutter your workspaces if you need to switch focus to another
 # task
-# This script doesn't proivde a way to view workspaces in the stack, nor does it
-# expect you to provide one in your sway config. The stack is for storage; pop
-# workspaces onto the "home row" (1-10) to view them.
+# The stack is for storage; pop workspaces onto the "home row" (1-10) to view
+# them. With --thumbnails, a downscaled screenshot is taken (with grim) of each
+# workspace pushed onto a stack, and --preview shows the cached thumbnails of
+# the focused stack without capturing anything.
 
 # Example sway config:
 #
@@ -18,70 +19,240 @@
 # bindsym $mod+$alt+d exec /path/to/swaystack.py --pop
 # bindsym $mod+$alt+r exec /path/to/swaystack.py --pop-rotate
 # bindsym $mod+$alt+e exec /path/to/swaystack.py --push-rotate
+# bindsym $mod+$alt+p exec /path/to/swaystack.py --preview --viewer imv
+#
+# `swaystack.py --list` prints the workspaces in each stack.
+#
+# Or, to skip starting python and connecting to sway on every keypress, run it
+# as a daemon and bind nop commands instead:
+#
+# exec /path/to/swaystack.py --daemon
+# bindsym $mod+$alt+s nop swaystack --push
+# bindsym $mod+$alt+d nop swaystack --pop
+# bindsym $mod+$alt+r nop swaystack --pop-rotate
+# bindsym $mod+$alt+e nop swaystack --push-rotate
 
 import argparse
+import os
+import shlex
+import subprocess
+import sys
 
 import i3ipc
 
+THUMBNAIL_SCALE = 0.2
+THUMBNAIL_CACHE_BYTES = 8 * 1024 * 1024
+THUMBNAIL_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "swaystack"
+)
+# container fields used with --lean-tree
+TREE_FIELDS = ("focused", "num", "rect")
+
+
+class StackIndex:
+    """Workspace numbers per home row slot, kept in sync from workspace events."""
+
+    def __init__(self):
+        self.nums = {}  # workspace id -> workspace number
+
+    def load(self):
+        self.nums = {w.ipc_data["id"]: w.num for w in ipc.get_workspaces()}
+
+    def on_workspace(self, _ipc, event):
+        if event.current is None:
+            return
+        if event.change == "empty":
+            num = self.nums.pop(event.current.id, None)
+            if num is not None and num > 10:
+                thumbnails.evict(num)
+        elif event.change in ("init", "rename"):
+            self.nums[event.current.id] = event.current.num
+        elif event.change == "reload":
+            self.load()
+
+    def stack(self, stack_num):
+        """Return the workspace numbers of a stack, home row first."""
+        num = stack_num % 10
+        return sorted(n for n in self.nums.values() if n is not None and n > 0 and n % 10 == num)
+
+    def top(self, stack_num):
+        """Return the number of the top workspace of a stack, None if it is empty."""
+        stack = self.stack(stack_num)
+        return stack[-1] if stack else None
+
+
+class ThumbnailCache:
+    """Downscaled screenshots of stacked workspaces, keyed by workspace number.
+
+    Thumbnails are files so they survive between one-shot runs; the oldest are
+    dropped once the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, num):
+        return os.path.join(self.directory, f"{num}.png")
+
+    def capture(self, num, rect):
+        os.makedirs(self.directory, exist_ok=True)
+        geometry = f"{rect.x},{rect.y} {rect.width}x{rect.height}"
+        try:
+            subprocess.run(
+                ("grim", "-s", str(THUMBNAIL_SCALE), "-g", geometry, self.path(num)),
+                check=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Could not capture thumbnail: {e}", file=sys.stderr)
+            return
+        self.trim()
+
+    def rename(self, old, new):
+        try:
+            os.replace(self.path(old), self.path(new))
+        except FileNotFoundError:
+            self.evict(new)
+
+    def evict(self, num):
+        try:
+            os.remove(self.path(num))
+        except FileNotFoundError:
+            pass
+
+    def cached(self):
+        """Return {workspace number: path} of all cached thumbnails."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return {}
+        return {int(name[:-4]): os.path.join(self.directory, name)
+                for name in names if name.endswith(".png") and name[:-4].isdigit()}
+
+    def prune(self, nums):
+        """Drop thumbnails of workspaces that are no longer stacked."""
+        for num in self.cached().keys() - set(nums):
+            self.evict(num)
+
+    def trim(self):
+        files = sorted(self.cached().values(), key=os.path.getmtime, reverse=True)
+        total = 0
+        for path in files:
+            total += os.path.getsize(path)
+            if total > self.max_bytes:
+                os.remove(path)
+
 
 def get_stack_top(stack_num):
-    num = stack_num % 10
-    return max(w.num for w in ipc.get_workspaces()
-               if w.num % 10 == num and w.num != 0)
+    return index.top(stack_num)
+
+
+def command(*commands):
+    # one message, so sway applies the whole operation without intermediate states
+    ipc.command("; ".join(commands))
 
 
-def workspace_push(workspace):
+def rename(commands, old, new):
+    commands.append(f"rename workspace {old} to {new}")
+    # thumbnails follow their workspace through the stack
+    thumbnails.rename(old, new)
+
+
+def workspace_push(workspace, capture=False):
     workspace_num = workspace.num
-    top_num = get_stack_top(workspace_num)
+    # the focused workspace is the bottom of its stack, also if not indexed yet
+    top_num = get_stack_top(workspace_num) or workspace_num
+    commands = []
 
     # if not empty, push onto stack
     if workspace.leaves():
-        ipc.command(f"rename workspace {workspace_num} to {top_num+10}")
-        ipc.command(f"workspace {workspace_num}")
+        if capture:
+            thumbnails.capture(workspace_num, workspace.rect)
+        rename(commands, workspace_num, top_num+10)
+        commands.append(f"workspace {workspace_num}")
+        command(*commands)
 
 
 def workspace_pop(workspace):
     workspace_num = workspace.num
     top_num = get_stack_top(workspace_num)
+    if top_num is None:
+        return
+    commands = []
 
     # if empty, pop from stack
     if not workspace.leaves():
-        ipc.command(f"workspace {top_num}")
-        ipc.command(f"rename workspace {top_num} to {workspace_num}")
+        commands.append(f"workspace {top_num}")
+        rename(commands, top_num, workspace_num)
+        command(*commands)
+        thumbnails.evict(workspace_num)
 
 
-def workspace_pop_rotate(workspace):
+def workspace_pop_rotate(workspace, capture=False):
     workspace_num = workspace.num
     top_num = get_stack_top(workspace_num)
+    if top_num is None:
+        return
+    commands = []
 
     # if workspace not empty, rotate stack before pop
     if workspace.leaves():
+        if capture:
+            thumbnails.capture(workspace_num, workspace.rect)
         for n in range(top_num, workspace_num-1, -10):
-            ipc.command(f"rename workspace {n} to {n+10}")
+            rename(commands, n, n+10)
 
         top_num += 10
 
     # pop
-    ipc.command(f"workspace {top_num}")
-    ipc.command(f"rename workspace {top_num} to {workspace_num}")
+    commands.append(f"workspace {top_num}")
+    rename(commands, top_num, workspace_num)
+    command(*commands)
+    thumbnails.evict(workspace_num)
 
 
-def workspace_push_rotate(workspace):
+def workspace_push_rotate(workspace, capture=False):
     workspace_num = workspace.num
-    top_num = get_stack_top(workspace_num)
+    top_num = get_stack_top(workspace_num) or workspace_num
+    commands = []
 
     # if workspace not empty, push before rotate
     if workspace.leaves():
-        ipc.command(f"rename workspace {workspace_num} to {top_num+10}")
+        if capture:
+            thumbnails.capture(workspace_num, workspace.rect)
+        rename(commands, workspace_num, top_num+10)
         top_num += 10
 
     # rotate
-    ipc.command(f"workspace {workspace_num+10}")
+    commands.append(f"workspace {workspace_num+10}")
     for n in range(workspace_num+10, top_num+1, 10):
-        ipc.command(f"rename workspace {n} to {n-10}")
+        rename(commands, n, n-10)
+    command(*commands)
+    thumbnails.evict(workspace_num)
 
 
-if __name__ == "__main__":
+def preview_stack(stack_num, viewer=None):
+    """Show the cached thumbnails of a stack, top of the stack first."""
+    cached = thumbnails.cached()
+    paths = []
+    for num in reversed(index.stack(stack_num)):
+        if num in cached:
+            print(f"{num}\t{cached[num]}")
+            paths.append(cached[num])
+    sys.stdout.flush()
+    if viewer and paths:
+        subprocess.Popen(shlex.split(viewer) + paths)
+
+
+def list_stacks():
+    for slot in range(1, 11):
+        stack = index.stack(slot)
+        if stack:
+            print(f"{slot}: {' '.join(str(n) for n in stack)}")
+    sys.stdout.flush()
+
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="Workspace stacking, for hoarding workspaces. Requires "
         "numerical workspaces 1-10."
@@ -107,20 +278,101 @@ if __name__ == "__main__":
         action="store_true",
         help="Rotate up along the focused workspace stack",
     )
-    args = parser.parse_args()
+    action.add_argument(
+        "--list",
+        action="store_true",
+        help="List the workspaces in each stack",
+    )
+    action.add_argument(
+        "--preview",
+        action="store_true",
+        help="Print the cached thumbnails of the focused workspace stack",
+    )
+    action.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Stay running and act on 'nop swaystack <option>' bindings",
+    )
+    parser.add_argument(
+        "--thumbnails",
+        action="store_true",
+        help="Capture a thumbnail of workspaces pushed onto a stack (needs grim)",
+    )
+    parser.add_argument(
+        "--viewer",
+        help="Command to open the thumbnails with --preview, e.g. imv",
+    )
+    parser.add_argument(
+        "--lean-tree",
+        action="store_true",
+        help="Read the layout tree with swaytree.py, keeping only the fields used here",
+    )
+    return parser.parse_args(argv)
 
-    ipc = i3ipc.Connection()
-    focused = ipc.get_tree().find_focused().workspace()
+
+def focused_workspace(lean_tree):
+    if lean_tree:
+        import swaytree
+
+        tree = swaytree.get_tree(ipc, TREE_FIELDS)
+    else:
+        tree = ipc.get_tree()
+    return tree.find_focused().workspace()
+
+
+def run(args):
+    if args.list:
+        list_stacks()
+        return True
+
+    focused = focused_workspace(args.lean_tree or lean_tree)
 
     # only call from "home row"
     if not (focused.num >= 1 and focused.num <= 10):
-        exit(1)
+        return False
 
-    if args.pop:
+    if args.preview:
+        preview_stack(focused.num, args.viewer)
+    elif args.pop:
         workspace_pop(focused)
     elif args.pop_rotate:
-        workspace_pop_rotate(focused)
+        workspace_pop_rotate(focused, args.thumbnails)
     elif args.push_rotate:
-        workspace_push_rotate(focused)
+        workspace_push_rotate(focused, args.thumbnails)
     else:
-        workspace_push(focused)
+        workspace_push(focused, args.thumbnails)
+    return True
+
+
+def on_binding(_ipc, event):
+    # whole words, so "nop swaystackfoo" is left to whatever binds it; other
+    # bindings are not split with shlex, their quoting is none of our business
+    if event.binding.command.split()[:2] != ["nop", "swaystack"]:
+        return
+    words = shlex.split(event.binding.command)
+    try:
+        args = parse_args(words[2:])
+    except SystemExit:
+        # argparse already printed what was wrong with the binding
+        return
+    if not args.daemon:
+        run(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # also applies to the bindings handled by the daemon
+    lean_tree = args.lean_tree
+
+    ipc = i3ipc.Connection()
+    index = StackIndex()
+    index.load()
+    thumbnails = ThumbnailCache(THUMBNAIL_DIR)
+    thumbnails.prune(n for n in index.nums.values() if n is not None and n > 10)
+
+    if args.daemon:
+        ipc.on(i3ipc.Event.WORKSPACE, index.on_workspace)
+        ipc.on(i3ipc.Event.BINDING, on_binding)
+        ipc.main()
+    elif not run(args):
+        sys.exit(1)
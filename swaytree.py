@@ -0,0 +1,167 @@
+# Lightweight model of the sway layout tree, for the scripts in this
+# repository that are run with --lean-tree.
+#
+# i3ipc's get_tree() turns every container of the reply into a Con with all
+# of its properties, rects and window properties. Most scripts only look at
+# a handful of them, so here the reply is decoded in a single json.loads()
+# pass whose object hook builds compact Node objects directly, copying just
+# the fields that were asked for. Nodes have the tree walking methods of
+# Con that the scripts use (workspaces(), find_focused(), leaves(), ...).
+#
+# This module requires i3ipc-python package (install it from a system package
+# manager or pip).
+
+import json
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+import i3ipc
+
+try:
+    # private to i3ipc, only used to get the reply without building the Cons
+    from i3ipc._private import MessageType
+
+    GET_TREE: Any = MessageType.GET_TREE
+except ImportError:
+    GET_TREE = None
+
+# fields a Node can carry besides id, type, name, nodes, floating_nodes and parent
+FIELDS: dict[str, Callable[[dict[str, Any]], Any]] = {
+    "app_id": lambda data: data.get("app_id"),
+    "window_class": lambda data: (data.get("window_properties") or {}).get("class"),
+    "window_instance": lambda data: (data.get("window_properties") or {}).get("instance"),
+    "focused": lambda data: data.get("focused"),
+    "layout": lambda data: data.get("layout"),
+    "num": lambda data: data.get("num"),
+    "pid": lambda data: data.get("pid"),
+    "marks": lambda data: data.get("marks") or [],
+    "rect": lambda data: i3ipc.Rect(data["rect"]),
+}
+
+
+class Node:
+    """A container of the layout tree.
+
+    Fields that were not asked for are left unset, so using one by mistake
+    raises AttributeError instead of quietly returning None.
+    """
+
+    __slots__ = ("id", "type", "name", "nodes", "floating_nodes", "parent", *FIELDS)
+
+    id: int
+    type: str
+    name: Optional[str]
+    nodes: list["Node"]
+    floating_nodes: list["Node"]
+    parent: Optional["Node"]
+    app_id: Optional[str]
+    window_class: Optional[str]
+    window_instance: Optional[str]
+    focused: bool
+    layout: str
+    num: Optional[int]
+    pid: Optional[int]
+    marks: list[str]
+    rect: i3ipc.Rect
+
+    def __iter__(self) -> Iterator["Node"]:
+        "iterate through the descendants of this node, breadth first"
+        queue = [*self.nodes, *self.floating_nodes]
+        for con in queue:
+            yield con
+            queue.extend(con.nodes)
+            queue.extend(con.floating_nodes)
+
+    def __repr__(self) -> str:
+        return f"<Node {self.type} {self.id} {self.name!r}>"
+
+    def descendants(self) -> list["Node"]:
+        return list(self)
+
+    def leaves(self) -> list["Node"]:
+        return [
+            con
+            for con in self
+            if not con.nodes and con.type == "con" and con.parent is not None and con.parent.type != "dockarea"
+        ]
+
+    def root(self) -> "Node":
+        con = self
+        while con.parent is not None:
+            con = con.parent
+        return con
+
+    def workspaces(self) -> list["Node"]:
+        workspaces = []
+        stack = [self.root()]
+        while stack:
+            con = stack.pop()
+            if con.type == "workspace":
+                if not (con.name or "").startswith("__"):
+                    workspaces.append(con)
+            else:
+                stack.extend(reversed(con.nodes))
+        return workspaces
+
+    def workspace(self) -> Optional["Node"]:
+        con: Optional[Node] = self
+        while con is not None and con.type != "workspace":
+            con = con.parent
+        return con
+
+    def find_focused(self) -> Optional["Node"]:
+        return next((con for con in self if con.focused), None)
+
+    def find_by_id(self, con_id: int) -> Optional["Node"]:
+        return next((con for con in self if con.id == con_id), None)
+
+
+def parse_tree(data: Union[bytes, str], fields: Iterable[str]) -> Node:
+    "build the tree of Nodes from a GET_TREE reply, keeping only fields"
+    getters = [(field, FIELDS[field]) for field in fields]
+
+    def hook(obj: dict[str, Any]) -> Any:
+        # rects, window_properties and such have no nodes and stay dicts
+        if "nodes" not in obj or "id" not in obj:
+            return obj
+        node = Node()
+        node.id = obj["id"]
+        node.type = obj["type"]
+        node.name = obj.get("name")
+        node.nodes = obj["nodes"]
+        node.floating_nodes = obj.get("floating_nodes", [])
+        node.parent = None
+        # the object hook runs on children first, so they are Nodes already
+        for child in node.nodes:
+            child.parent = node
+        for child in node.floating_nodes:
+            child.parent = node
+        for field, getter in getters:
+            setattr(node, field, getter(obj))
+        return node
+
+    return json.loads(data, object_hook=hook)
+
+
+def get_tree(ipc: Any, fields: Iterable[str]) -> Node:
+    """Get the layout tree with only fields of each container.
+
+    plugin-host.py shares the raw reply between the scripts it runs, with a
+    plain i3ipc.Connection the reply is requested directly.
+    """
+    get_tree_data = getattr(ipc, "get_tree_data", None)
+    if get_tree_data is not None:
+        return parse_tree(get_tree_data(), fields)
+    return parse_tree(read_tree_data(ipc), fields)
+
+
+def read_tree_data(ipc: i3ipc.Connection) -> Union[bytes, str]:
+    """The raw GET_TREE reply on an i3ipc.Connection.
+
+    This needs i3ipc's private API. Where an i3ipc version lacks it, the tree
+    is read with the public get_tree() and encoded again, which is slower but
+    gives the same result.
+    """
+    if GET_TREE is None or not hasattr(ipc, "_message"):
+        return json.dumps(ipc.get_tree().ipc_data)
+    # the request i3ipc's get_tree() makes, without building the Cons
+    return ipc._message(GET_TREE, "")
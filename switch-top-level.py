@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import argparse
+
 import i3ipc
 
 #
@@ -30,17 +32,25 @@ import i3ipc
 
 
 class TopLevelSwitcher:
-    def __init__(self):
-        self.top_to_selected = {} # top i3ipc.Con -> selected container id
-        self.con_to_top = {} # container id -> top i3ipc.Con
+    def __init__(self, i3, lean_tree=False):
+        self.top_to_selected = {} # top container id -> selected container id
+        self.con_to_top = {} # container id -> top container id, None for floating
+        self.top_to_ws = {} # top container id -> workspace id
+        self.ws_tops = {} # workspace id -> top container ids in order
+        self.top_windows = {} # top container id -> ids of the windows in it
         self.prev = None # previously focused container id
+        self.dirty = True # the layout changed since the index was built
 
-        self.i3 = i3ipc.Connection()
+        self.i3 = i3
+        self.lean_tree = lean_tree
         self.i3.on("window::focus", self.on_window_focus)
+        self.i3.on("window::new", self.on_window_new)
+        self.i3.on("window::move", self.on_window_move)
+        self.i3.on("window::floating", self.on_window_move)
+        self.i3.on("window::close", self.on_window_close)
         self.i3.on(i3ipc.Event.BINDING, self.on_binding)
 
         self.update_top_level()
-        self.i3.main()
 
     def top_level(self, node):
         if len(node.nodes) == 1:
@@ -48,18 +58,47 @@ class TopLevelSwitcher:
         return node.nodes
 
     def update_top_level(self):
-        tree = self.i3.get_tree()
+        """Rebuild the index from the tree, dropping containers that are gone."""
+        old_selected = self.top_to_selected
+        self.top_to_selected = {}
+        self.con_to_top = {}
+        self.top_to_ws = {}
+        self.ws_tops = {}
+        self.top_windows = {}
+        self.dirty = False
+
+        if self.lean_tree:
+            # only ids, types and the structure are needed
+            import swaytree
+
+            tree = swaytree.get_tree(self.i3, ())
+        else:
+            tree = self.i3.get_tree()
         for ws in tree.workspaces():
-            for con in self.top_level(ws):
+            tops = self.top_level(ws)
+            self.ws_tops[ws.id] = [con.id for con in tops]
+            for con in tops:
+                self.top_to_ws[con.id] = ws.id
+                self.top_windows[con.id] = set()
                 self.update_top_level_rec(con, con.id)
+            for con in ws.floating_nodes:
+                for child in [con] + con.descendants():
+                    self.con_to_top[child.id] = None
+
+        # keep the selection of top-level containers that still hold it
+        for top, selected in old_selected.items():
+            if self.con_to_top.get(selected) == top:
+                self.top_to_selected[top] = selected
 
-    def update_top_level_rec(self, con: i3ipc.Con, top: i3ipc.Con):
+    def update_top_level_rec(self, con: i3ipc.Con, top: int):
         self.con_to_top[con.id] = top
         for child in con.nodes:
             self.update_top_level_rec(child, top)
 
-        if len(con.nodes) == 0 and top not in self.top_to_selected:
-            self.top_to_selected[top] = con.id
+        if len(con.nodes) == 0:
+            self.top_windows[top].add(con.id)
+            if top not in self.top_to_selected:
+                self.top_to_selected[top] = con.id
 
     def save_prev(self):
         if not self.prev:
@@ -69,23 +108,84 @@ class TopLevelSwitcher:
             return
         self.top_to_selected[prev_top] = self.prev
 
+    def drop_top(self, top):
+        """Forget a top-level container that left its workspace."""
+        self.top_to_selected.pop(top, None)
+        self.top_windows.pop(top, None)
+        for con_id in [con_id for con_id, con_top in self.con_to_top.items() if con_top == top]:
+            del self.con_to_top[con_id]
+        tops = self.ws_tops.get(self.top_to_ws.pop(top, None), [])
+        if top in tops:
+            tops.remove(top)
+        # with one top-level container left, its children become top-level
+        if len(tops) <= 1:
+            self.dirty = True
+
+    def forget(self, con):
+        """Drop a container and the ones below it from the index."""
+        for child in [con] + con.descendants():
+            top = self.con_to_top.pop(child.id, None)
+            if top is None:
+                continue
+            if self.top_to_selected.get(top) == child.id:
+                del self.top_to_selected[top]
+            windows = self.top_windows.get(top)
+            if top == child.id:
+                self.drop_top(top)
+            elif windows is not None:
+                windows.discard(child.id)
+                # sway reaps a container when its last window goes, without an event
+                if not windows:
+                    self.drop_top(top)
+
+    def on_window_new(self, _i3, event):
+        con = event.container
+        if con.type == "floating_con":
+            self.con_to_top[con.id] = None
+            return
+        # where a tiled window opens depends on splits made since the index was
+        # built, which send no event, so rebuild lazily on the next focus
+        self.dirty = True
+
+    def on_window_move(self, _i3, event):
+        # the event does not say where the container went, so it is looked up
+        # again once it is focused; its old workspace is updated right away
+        self.forget(event.container)
+        if event.container.type == "floating_con":
+            for child in [event.container] + event.container.descendants():
+                self.con_to_top[child.id] = None
+
+    def on_window_close(self, _i3, event):
+        self.forget(event.container)
+        if self.prev == event.container.id:
+            self.prev = None
 
     def on_window_focus(self, _i3, event):
-        self.update_top_level()
+        if self.dirty or event.container.id not in self.con_to_top:
+            self.update_top_level()
         self.save_prev()
         self.prev = event.container.id
 
-    def on_top(self, _i3, _event, diff: int):
-        root = self.i3.get_tree()
+    def on_top(self, _i3, _event, diff: int, rebuilt=False):
         if not self.prev:
             return
-        top = self.con_to_top[self.prev]
-        ws = [top.id for top in self.top_level(root.find_focused().workspace())]
+        if self.dirty or self.prev not in self.con_to_top:
+            self.update_top_level()
+        top = self.con_to_top.get(self.prev)
+        if top is None:
+            return
+        ws = self.ws_tops[self.top_to_ws[top]]
 
         top_idx = ws.index(top)
         top_idx = (top_idx + diff + len(ws)) % len(ws)
         next_top = ws[top_idx]
         next_window = self.top_to_selected.get(next_top)
+        if next_window is None:
+            # the index missed a change after all, look at the tree once
+            if not rebuilt:
+                self.update_top_level()
+                self.on_top(_i3, _event, diff, rebuilt=True)
+            return
         self.i3.command("[con_id=%s] focus" % next_window)
 
     def on_binding(self, i3, event):
@@ -95,5 +195,21 @@ class TopLevelSwitcher:
             self.on_top(i3, event, -1)
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Switch between top-level containers of a workspace.")
+    parser.add_argument(
+        "--lean-tree",
+        action="store_true",
+        help="read the layout tree with swaytree.py, keeping only what is used here",
+    )
+    return parser.parse_args(argv)
+
+
+def setup(i3, args):
+    TopLevelSwitcher(i3, args.lean_tree)
+
+
 if __name__ == "__main__":
-    TopLevelSwitcher()
+    i3 = i3ipc.Connection()
+    setup(i3, parse_args())
+    i3.main()